@@ -0,0 +1,351 @@
+# coding=utf-8
+
+import numpy as np
+import scipy.fft as scifft
+import scipy.special as scispecial
+
+from stats import stats
+
+
+def interpolate_peak(values: np.ndarray, index: int, gaussian: bool = True) -> float:
+    # offset in bins of the true maximum from values[index],
+    # fitting a parabola through the peak and its two neighbours,
+    # on the log values for gaussian (exact for a gaussian shaped peak)
+    if index <= 0 or index >= len(values) - 1:
+        return 0.0
+    # in double whatever the spectrum, a float32 offset would round the pitch
+    a, b, c = values[index - 1:index + 2].astype(np.float64)
+    if gaussian:
+        if min(a, b, c) <= 0:
+            return interpolate_peak(values, index, False)
+        a, b, c = np.log(a), np.log(b), np.log(c)
+    denominator = a - 2 * b + c
+    if denominator >= 0:
+        return 0.0
+    return 0.5 * (a - c) / denominator
+
+
+def interpolate_peaks(values: np.ndarray, index: np.ndarray, gaussian: bool = True) -> np.ndarray:
+    # interpolate_peak for every row of values at once, index holds one bin per row
+    offsets = np.zeros(len(index))
+    inside = (index > 0) & (index < values.shape[1] - 1)
+    rows = np.flatnonzero(inside)
+    a, b, c = (values[rows, index[rows] + shift].astype(np.float64) for shift in (-1, 0, 1))
+    if gaussian:
+        # rows with a bin at or below zero fall back to the parabola
+        positive = (a > 0) & (b > 0) & (c > 0)
+        a, b, c = (np.where(positive, np.log(np.where(positive, v, 1)), v) for v in (a, b, c))
+    denominator = a - 2 * b + c
+    valid = denominator < 0
+    offsets[rows[valid]] = 0.5 * (a[valid] - c[valid]) / denominator[valid]
+    return offsets
+
+
+def frame_view(signal: np.ndarray, size: int, hop: int) -> np.ndarray:
+    # (frames, size) overlapping frames of signal, hop samples apart, without a copy
+    if len(signal) < size:
+        return np.zeros((0, size), dtype=signal.dtype)
+    return np.lib.stride_tricks.sliding_window_view(signal, size)[::hop]
+
+
+def zoom_dft(samples: np.ndarray, frequencies: np.ndarray, sample_rate: float, block: int = 128) -> np.ndarray:
+    # DFT of samples evaluated at arbitrary frequencies (Hz),
+    # exp(-jwt) is split into exp(-jwi) * exp(-jwbB) with t = bB + i,
+    # so only (block + len / block) complex exponentials per frequency are needed
+    # and the rest is one real matrix product
+    omega = 2 * np.pi * np.asarray(frequencies, dtype=np.float64).ravel() / sample_rate
+    count = len(samples)
+    blocks = -(-count // block)
+    if blocks * block != count:
+        samples = np.concatenate((samples, np.zeros(blocks * block - count, dtype=samples.dtype)))
+    angle = np.outer(np.arange(block), omega)
+    matrix = samples.reshape(blocks, block)
+    # real input, keep the big product real
+    inner = matrix @ np.cos(angle) - 1j * (matrix @ np.sin(angle))
+    outer = np.exp(-1j * np.outer(np.arange(blocks) * block, omega))
+    result = np.einsum('bm,bm->m', inner, outer)
+    return result.reshape(np.shape(frequencies))
+
+
+def harmonic_score(magnitudes: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    # log of the geometric mean of the harmonic magnitudes (last axis) below nyquist
+    logs = np.where(valid, np.log(magnitudes + 1e-12), 0)
+    return logs.sum(axis=-1) / np.maximum(valid.sum(axis=-1), 1)
+
+
+def zoom_peak(windowed: np.ndarray, frequency: float, sample_rate: float,
+              cents: float = 50, harmonics: int = 1, step: float = 10, points: int = 64) -> float:
+    # Finds the peak within +-cents of frequency with two small zoom DFTs
+    # of the (hanning) windowed samples, scoring every candidate on its
+    # first harmonics like the harmonic product spectrum does.
+    resolution = sample_rate / len(windowed)
+    orders = np.arange(1, harmonics + 1)
+
+    def score(candidates):
+        frequencies = candidates[:, None] * orders
+        valid = frequencies < sample_rate / 2
+        magnitudes = np.abs(zoom_dft(windowed, np.where(valid, frequencies, 0), sample_rate))
+        return harmonic_score(magnitudes, valid)
+
+    # grid about one bin apart where points allows
+    step = min(step, 1200 * np.log2(1 + resolution / frequency))
+    count = min(int(np.ceil(2 * cents / step)) + 1, points)
+    candidates = frequency * 2 ** (np.linspace(-cents, cents, count) / 1200)
+    index = int(np.argmax(score(candidates)))
+    best = candidates[index]
+
+    # the peak is within half a grid step of the best point, bracket it
+    # and interpolate, hanning peaks are close to gaussian, then once more
+    # much closer to the peak where the gaussian fit is nearly exact
+    spacing = candidates[min(index + 1, count - 1)] - candidates[max(index - 1, 0)]
+    for delta in (max(resolution, spacing / 2) / 2, resolution / 16):
+        offset = interpolate_peak(np.exp(score(best + np.array([-delta, 0, delta]))), 1)
+        best += offset * delta
+    return best
+
+
+class AnalysisFrame(object):
+
+    # one published analysis result, preallocated and recycled through a SnapshotPool
+
+    def __init__(self, size: int) -> None:
+        self.buffer = np.zeros(size)
+        self.spectrum = np.zeros(size // 2)
+        self.optimized = np.zeros(size // 2)
+        self.frequencies = None
+        self.frequency = 0.0
+        self.confidence = 0.0
+        # engine.PitchResult of frequency
+        self.result = None
+        # perf_counter when the worker published it
+        self.published = 0.0
+        # seconds spent in the pitch detector
+        self.cost = 0.0
+        # frames the activity gate skipped so far
+        self.skipped = 0
+
+
+class HarmonicProductSpectrumPlan(object):
+
+    # Everything the harmonic product spectrum needs that only depends on
+    # (sample rate, buffer size, harmonics), computed once when the stream
+    # (re)starts. process() only runs the transform and in place multiplies.
+
+    # References:
+    # http://musicweb.ucsd.edu/~trsmyth/analysis/Harmonic_Product_Spectrum.html
+
+    LOW_FREQUENCY = 200
+    # no note is higher, the peak is only searched below
+    HIGH_FREQUENCY = 5000
+    REFINEMENTS = ('none', 'quadratic', 'gaussian', 'phase', 'zoom')
+    ZOOM_CENTS = 60
+    FULL_SCALE = 32768
+    # float32 only, the product of all harmonics of a full scale tone, and
+    # the floor every factor is clamped to so nothing underflows, -140 dB
+    # below the frame's own peak, a quiet frame keeps its products as clean
+    # as a loud one and subharmonics never score floor ** 2 times a peak
+    SINGLE_RANGE = 1e30
+    SINGLE_FLOOR = 1e-7
+
+    def __init__(self, sample_rate: int, size: int, harmonics: int, dtype=np.float64) -> None:
+        self.sample_rate = sample_rate
+        self.size = size
+        self.harmonics = harmonics
+        # float32 keeps the window, transform (complex64) and products in single precision
+        self.dtype = np.dtype(dtype)
+
+        # shannon nyquist theorem
+        self.bins = size // 2
+        self.resolution = sample_rate / size
+        self.frequencies = scifft.rfftfreq(size, 1. / sample_rate)[:self.bins]
+        self.window = np.hanning(size).astype(self.dtype)
+        self.floor = 0.0
+        if self.dtype == np.float32:
+            # unscaled the products overflow float32 at large sizes, scaled
+            # to 1 they shrink below the single factor bins above bins / 2
+            peak = self.SINGLE_RANGE ** (1 / harmonics)
+            self.window *= 2 * peak / (self.window.sum() * self.FULL_SCALE)
+            self.floor = self.SINGLE_FLOOR
+
+        self.spectrum = np.zeros(self.bins, dtype=self.dtype)
+        self.optimized = np.zeros(self.bins, dtype=self.dtype)
+        # what the products multiply, the spectrum itself without a floor
+        self.factors = np.zeros(self.bins, dtype=self.dtype) if self.floor else self.spectrum
+        self.transform = None
+        self.previous = None
+        self.windowed = None
+
+        # smooth low frequencis
+        self.weighting = np.ones(self.bins, dtype=self.dtype)
+        args = np.argwhere(self.frequencies < self.LOW_FREQUENCY)[-1, 0]
+        x = (np.arange(args) - args // 2) / args * 8
+        self.weighting[:args] = scispecial.expit(x)
+        self.high = max(1, min(self.bins, int(np.ceil(self.HIGH_FREQUENCY / self.resolution)) + 1))
+
+        # (target, source) view pairs, optimized[:ceil(bins / h)] *= spectrum[::h]
+        self.products = []
+        for harmonic in range(2, harmonics + 1):
+            hps_len = int(np.ceil(self.bins / harmonic))
+            self.products.append((self.optimized[:hps_len], self.factors[::harmonic]))
+        # (start, end, exponent), the bins from ceil(bins / (n + 1)) to
+        # ceil(bins / n) only have n harmonics below nyquist, their product
+        # is raised to harmonics / n so it competes with the full ones,
+        # otherwise a note in the top half loses to its subharmonics
+        self.partial = []
+        for count in range(1, harmonics):
+            start, end = (int(np.ceil(self.bins / n)) for n in (count + 1, count))
+            self.partial.append((start, end, harmonics / count))
+
+    def key(self):
+        return (self.sample_rate, self.size, self.harmonics, self.dtype)
+
+    def reset(self):
+        # forget the previous frame, the next one is not its continuation
+        self.transform = None
+        self.previous = None
+
+    def process(self, buffer: np.ndarray):
+        # buffer is expected to be windowed already
+        self.windowed = buffer
+        with stats.time('fft'):
+            transform = scifft.rfft(buffer)
+            np.absolute(transform[:self.bins], out=self.spectrum)
+        # kept for the phase vocoder estimate of the next frame
+        self.previous, self.transform = self.transform, transform
+
+        with stats.time('hps'):
+            if self.floor:
+                np.maximum(self.spectrum, self.spectrum.max() * self.floor, out=self.factors)
+            np.multiply(self.factors, self.weighting, out=self.optimized)
+            for target, source in self.products:
+                np.multiply(target, source, out=target)
+            for start, end, exponent in self.partial:
+                np.power(self.optimized[start:end], exponent, out=self.optimized[start:end])
+
+        return self.spectrum, self.optimized
+
+    def peak(self, refinement: str = 'gaussian', hop: int = 0) -> float:
+        with stats.time('peak'):
+            return self.find_peak(refinement, hop)
+
+    def find_peak(self, refinement: str = 'gaussian', hop: int = 0) -> float:
+        # hop is the number of samples between this frame and the previous one
+        index = int(np.argmax(self.optimized[:self.high]))
+        if refinement == 'none':
+            return index * self.resolution
+        if refinement == 'zoom':
+            return self.zoom_peak(index * self.resolution)
+
+        # the low frequency weighting skews the shape of optimized,
+        # so the peak is refined on the plain magnitude spectrum
+        if 0 < index < self.bins - 1:
+            index += int(np.argmax(self.spectrum[index - 1:index + 2])) - 1
+        offset = interpolate_peak(self.spectrum, index, refinement != 'quadratic')
+        if refinement == 'phase' and hop > 0 and self.previous is not None:
+            offset = self.phase_offset(index, hop, offset)
+        return (index + offset) * self.resolution
+
+    def process_frames(self, frames: np.ndarray, refinement: str = 'gaussian', hop: int = 0, previous=None):
+        # process() and peak() for a (frames, size) block of unwindowed frames
+        # in batched numpy operations, previous is the transform of the frame
+        # before the first one, returns (frequencies, transform of the last frame)
+        count = len(frames)
+        transform = scifft.rfft(frames * self.window, axis=1)
+        spectrum = np.abs(transform[:, :self.bins])
+        factors = np.maximum(spectrum, spectrum.max(axis=1, keepdims=True) * self.floor) if self.floor else spectrum
+        optimized = factors * self.weighting
+        for harmonic in range(2, self.harmonics + 1):
+            length = int(np.ceil(self.bins / harmonic))
+            optimized[:, :length] *= factors[:, ::harmonic]
+        for start, end, exponent in self.partial:
+            np.power(optimized[:, start:end], exponent, out=optimized[:, start:end])
+
+        index = np.argmax(optimized[:, :self.high], axis=1)
+        last = transform[-1] if count else previous
+        if refinement == 'none':
+            return index * self.resolution, last
+        if refinement == 'zoom':
+            # a fine grid per frame, there is nothing to batch
+            frequencies = np.empty(count)
+            for i in range(count):
+                self.windowed = frames[i] * self.window
+                frequencies[i] = self.zoom_peak(index[i] * self.resolution)
+            return frequencies, last
+
+        rows = np.arange(count)
+        inside = (index > 0) & (index < self.bins - 1)
+        neighbours = spectrum[rows[:, None], np.clip(index[:, None] + np.arange(-1, 2), 0, self.bins - 1)]
+        index = np.where(inside, index + np.argmax(neighbours, axis=1) - 1, index)
+        offsets = interpolate_peaks(spectrum, index, refinement != 'quadratic')
+        if refinement == 'phase' and hop > 0 and count:
+            before = np.empty(count, dtype=transform.dtype)
+            before[1:] = transform[rows[:-1], index[1:]]
+            known = np.ones(count, dtype=bool)
+            if previous is None:
+                known[0] = False
+                before[0] = 0
+            else:
+                before[0] = previous[index[0]]
+            phased = self.phase_offsets(index, hop, offsets, transform[rows, index], before)
+            offsets = np.where(known, phased, offsets)
+        return (index + offsets) * self.resolution, last
+
+    def phase_offsets(self, index: np.ndarray, hop: int, estimate: np.ndarray, current: np.ndarray, previous: np.ndarray):
+        # phase_offset for many frames, current and previous are the transforms at index
+        expected = 2 * np.pi * index * hop / self.size
+        advance = np.angle(current.astype(np.complex128)) - np.angle(previous.astype(np.complex128)) - expected
+        advance = (advance + np.pi) % (2 * np.pi) - np.pi
+        period = self.size / hop
+        offset = advance / (2 * np.pi) * period
+        offset += np.round((estimate - offset) / period) * period
+        return np.where(np.abs(offset - estimate) > 0.5, estimate, offset)
+
+    def phase_offset(self, index: int, hop: int, estimate: float) -> float:
+        # References:
+        # https://www.dsprelated.com/showarticle/1266.php (phase vocoder)
+        expected = 2 * np.pi * index * hop / self.size
+        advance = np.angle(complex(self.transform[index])) - np.angle(complex(self.previous[index])) - expected
+        advance = (advance + np.pi) % (2 * np.pi) - np.pi
+
+        # the advance is only known modulo 2 pi, which is period bins,
+        # take the alias closest to the interpolated estimate
+        period = self.size / hop
+        offset = advance / (2 * np.pi) * period
+        offset += np.round((estimate - offset) / period) * period
+        if abs(offset - estimate) > 0.5:
+            return estimate
+        return offset
+
+    def zoom_peak(self, frequency: float) -> float:
+        # second stage, a fine grid around the coarse bin only, at most
+        # ZOOM_CENTS wide but always covering the coarse bin itself
+        if frequency <= 0:
+            return frequency
+        width = 1200 * np.log2(1 + self.resolution / frequency)
+        cents = max(min(self.ZOOM_CENTS, width), width * 0.6)
+        return zoom_peak(self.windowed, frequency, self.sample_rate, cents, self.harmonics)
+
+
+def analyse_signal(signal: np.ndarray, plan: HarmonicProductSpectrumPlan, hop: int,
+                   refinement: str = 'gaussian', budget: int = 64 << 20, pad: bool = True) -> np.ndarray:
+    # The HPS pitch of every hop of a long signal, frame k ending at sample
+    # (k + 1) * hop like the live path sees it after the same samples. With pad
+    # the window starts out zero filled as the live ring buffer does, without
+    # it the first frame is the first full window. Frames are strided views
+    # of the signal, processed budget bytes at a time (the windowed frames,
+    # their transform and spectra take about 5 * size * 8 bytes each).
+    signal = np.asarray(signal, dtype=plan.dtype)
+    if pad and hop < plan.size:
+        signal = np.concatenate((np.zeros(plan.size - hop, dtype=plan.dtype), signal))
+    elif pad:
+        # hops longer than the window never see the zeros, frame k starts
+        # hop - size samples into hop k
+        signal = signal[hop - plan.size:]
+    frames = frame_view(signal, plan.size, hop)
+    step = max(1, budget // (plan.size * 8 * 5))
+    frequencies = np.empty(len(frames))
+    previous = None
+    for start in range(0, len(frames), step):
+        frequencies[start:start + step], previous = plan.process_frames(
+            frames[start:start + step], refinement, hop, previous)
+    return frequencies
@@ -0,0 +1,151 @@
+# coding=utf-8
+
+import os
+import sys
+import csv
+import time
+import argparse
+import concurrent.futures
+
+import numpy as np
+
+from logger import logger
+from engine import PitchEngine
+from detectors import DETECTORS
+from readers import open_reader
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+COLUMNS = ['time', 'frequency', 'note', 'octave', 'cents', 'confidence']
+
+
+class TrackWriter(object):
+
+    # rows go to disk as they come, parquet in row groups of BATCH rows
+
+    BATCH = 4096
+
+    def __init__(self, path: str, format: str) -> None:
+        self.format = format
+        self.rows = []
+        if format == 'csv':
+            self.file = open(path, 'w', newline='')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(COLUMNS)
+        else:
+            if pyarrow is None:
+                raise RuntimeError("parquet output needs the pyarrow package")
+            self.schema = pyarrow.schema([
+                ('time', pyarrow.float64()), ('frequency', pyarrow.float64()),
+                ('note', pyarrow.string()), ('octave', pyarrow.int32()),
+                ('cents', pyarrow.float64()), ('confidence', pyarrow.float64()),
+            ])
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, row):
+        if self.format == 'csv':
+            self.writer.writerow(row)
+            return
+        self.rows.append(row)
+        if len(self.rows) >= self.BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.format == 'csv' or not self.rows:
+            return
+        columns = list(zip(*self.rows))
+        self.writer.write_table(pyarrow.table(
+            {name: list(column) for name, column in zip(COLUMNS, columns)}, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.format == 'csv':
+            self.file.close()
+        else:
+            self.writer.close()
+
+
+def analyse_file(path: str, output: str, format: str, options: dict):
+    # runs in a pool process, returns (path, seconds of audio, seconds spent, frames),
+    # the file is read one hop at a time so memory does not grow with its length
+    start = time.perf_counter()
+    sample_rate, blocks = open_reader(path)
+    engine = PitchEngine(sample_rate, **options)
+    writer = TrackWriter(output, format)
+    samples = 0
+    frames = 0
+    try:
+        for block in blocks(engine.hop):
+            engine.feed(block)
+            samples += len(block)
+            if len(block) < engine.hop:
+                break
+            result = engine.analyse()
+            if result is None:
+                continue
+            frames += 1
+            writer.write((
+                samples / sample_rate, result.frequency, result.note or '',
+                result.octave, result.cents, result.confidence))
+    finally:
+        writer.close()
+    return path, samples / sample_rate, time.perf_counter() - start, frames
+
+
+def output_path(path: str, directory: str, format: str):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(directory or os.path.dirname(path), f'{name}.{format}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pitch tracks of recorded takes")
+    parser.add_argument('files', nargs='+', help="wav files, capture recordings, flac and others with soundfile installed")
+    parser.add_argument('-o', '--output', default=None, help="output directory, next to the input by default")
+    parser.add_argument('-f', '--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('-d', '--detector', choices=list(DETECTORS), default=PitchEngine.DETECTOR)
+    parser.add_argument('-w', '--window', type=int, default=PitchEngine.WINDOW_SIZE, help="window size in samples")
+    parser.add_argument('-r', '--rate', type=int, default=PitchEngine.ANALYSIS_RATE, help="analyses per second")
+    parser.add_argument('--decimation', type=int, default=PitchEngine.DECIMATION)
+    parser.add_argument('--gate', action='store_true', help="skip silence and steady notes like the live view")
+    parser.add_argument('-p', '--precision', choices=list(PitchEngine.PRECISIONS), default=PitchEngine.PRECISION)
+    args = parser.parse_args(argv)
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    options = dict(
+        window_size=args.window, detector=args.detector, analyses=args.rate,
+        decimation=args.decimation, gate=args.gate, precision=args.precision)
+
+    start = time.perf_counter()
+    total = 0.0
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {
+            pool.submit(analyse_file, path, output_path(path, args.output, args.format), args.format, options): path
+            for path in args.files
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                path, seconds, spent, frames = future.result()
+            except Exception as e:
+                failed += 1
+                logger.error("%s: %s", futures[future], e)
+                continue
+            total += seconds
+            logger.info("%s: %.1f s of audio, %d frames, %.1f x realtime", path, seconds, frames, seconds / max(spent, 1e-9))
+
+    elapsed = time.perf_counter() - start
+    logger.info("%d files, %.1f s of audio in %.1f s, %.1f s of audio per second",
+                len(args.files) - failed, total, elapsed, total / max(elapsed, 1e-9))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
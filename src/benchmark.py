@@ -0,0 +1,252 @@
+# coding=utf-8
+
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+import platform
+import itertools
+
+import numpy as np
+
+from logger import logger
+from engine import PitchEngine, A0, KEYS
+from analysis import analyse_signal
+from decimator import Decimator
+
+
+DIRNAME = os.path.dirname(os.path.abspath(__file__))
+VERSION = runpy.run_path(os.path.join(DIRNAME, '__init__.py'))['VERSION']
+
+SAMPLE_RATE = 44100
+SEED = 2023
+# device block sizes, window sizes and harmonics, the Tuner CHUNK_SIZE,
+# BUFFER_SIZE and HPS_HARMONICS
+CHUNK_SIZES = [512, 2048]
+BUFFER_SIZES = [4096, 8192, 20480]
+HARMONICS = [2, 3, 5]
+PRECISIONS = list(PitchEngine.PRECISIONS)
+# the Tuner DECIMATION, 4 analyses 44.1 kHz input at 11025 Hz
+DECIMATIONS = [1, 4]
+# a result further than this from the true pitch is a wrong note
+WRONG_CENTS = 50
+# throughput drop or cents error growth reported by --compare
+TOLERANCE = 0.1
+# window sizes, analysis rates and refinements --verify runs the offline
+# path with, 10 analyses a second of a 2048 window hop past the window
+VERIFY_WINDOWS = [2048, 8192]
+VERIFY_RATES = [10, 20, 200]
+VERIFY_REFINEMENTS = ['none', 'gaussian', 'phase', 'zoom']
+VERIFY_DECIMATIONS = [1, 4]
+
+
+def tone(frequency: float, seconds: float, harmonics=(1,), amplitude: float = 0.5):
+    # sum of the given harmonics, falling off as 1 / h, peak near amplitude
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    signal = np.zeros(len(t))
+    for h in harmonics:
+        if frequency * h < SAMPLE_RATE / 2:
+            signal += np.sin(2 * np.pi * frequency * h * t) / h
+    return signal * amplitude / max(np.abs(signal).max(), 1e-12)
+
+
+def cases(seconds: float, rng: np.random.Generator):
+    # (name, true frequency, float signal), the same every run for a seed
+    keys = A0 * 2 ** (np.arange(KEYS) / 12)
+    a4 = keys[48]
+    for frequency in keys:
+        yield 'pure', frequency, tone(frequency, seconds)
+    for frequency in keys:
+        yield 'harmonic', frequency, tone(frequency, seconds, range(1, 7))
+    for frequency in keys[12:60:4]:
+        # the fundamental itself is missing
+        yield 'missing fundamental', frequency, tone(frequency, seconds, range(2, 7))
+    for cents in (-23, -7, 7, 23):
+        frequency = a4 * 2 ** (cents / 1200)
+        yield f'detuned {cents:+d}', frequency, tone(frequency, seconds, range(1, 4))
+    for snr in (20, 10, 0):
+        for frequency in keys[24:72:8]:
+            signal = tone(frequency, seconds, range(1, 4))
+            noise = rng.standard_normal(len(signal))
+            noise *= np.sqrt(np.mean(signal ** 2) / np.mean(noise ** 2) / 10 ** (snr / 10))
+            yield f'noise {snr} dB', frequency, signal + noise
+
+
+def run(chunk_size: int, window_size: int, harmonics: int, precision: str, decimation: int, detector: str, signals):
+    latencies = []
+    errors = {}
+    audio = 0.0
+    busy = 0.0
+    for name, frequency, signal in signals:
+        # a fresh engine per signal, nothing carries over from the previous one
+        engine = PitchEngine(SAMPLE_RATE, window_size, detector, harmonics=harmonics, gate=False,
+                             precision=precision, decimation=decimation)
+        # the first frames see a partly empty window, of decimated samples
+        warmup = -(-window_size * engine.factor() // engine.hop)
+        samples = (signal * 32767).astype(np.int16)
+        found = []
+        for start in range(0, len(samples), chunk_size):
+            begin = time.perf_counter()
+            results = engine.process(samples[start:start + chunk_size])
+            spent = time.perf_counter() - begin
+            busy += spent
+            if results:
+                latencies.append(spent / len(results))
+            found.extend(result.frequency for result in results)
+        audio += len(samples) / SAMPLE_RATE
+
+        found = np.array(found[warmup:])
+        cents = 1200 * np.log2(np.maximum(found, 1e-6) / frequency)
+        errors.setdefault(name, []).append(cents)
+
+    latencies = np.array(latencies) * 1000
+    result = {
+        'chunk_size': chunk_size,
+        'buffer_size': window_size,
+        'harmonics': harmonics,
+        'precision': precision,
+        'decimation': decimation,
+        'detector': detector,
+        'throughput': audio / busy,
+        'latency_ms': {
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'max': float(latencies.max()),
+        },
+        'cases': {},
+    }
+    for name, values in errors.items():
+        values = np.abs(np.concatenate(values))
+        right = values[values < WRONG_CENTS]
+        result['cases'][name] = {
+            'frames': len(values),
+            'wrong': float(np.mean(values >= WRONG_CENTS)),
+            'median_cents': float(np.median(right)) if len(right) else None,
+            'p95_cents': float(np.percentile(right, 95)) if len(right) else None,
+        }
+    return result
+
+
+def verify(seconds: float, precisions=PRECISIONS):
+    # settings where analyse_signal differs from the live engine on a vibrato
+    # note, the two must agree frame for frame
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    frequency = 330 * 2 ** (np.sin(2 * np.pi * 0.5 * t) * 0.3 / 12)
+    phase = 2 * np.pi * np.cumsum(frequency) / SAMPLE_RATE
+    samples = (12000 * np.sin(phase) + 3000 * np.sin(2 * phase)).astype(np.int16)
+    mismatches = []
+    settings = itertools.product(VERIFY_WINDOWS, VERIFY_RATES, VERIFY_REFINEMENTS, precisions, VERIFY_DECIMATIONS)
+    for window_size, analyses, refinement, precision, decimation in settings:
+        engine = PitchEngine(SAMPLE_RATE, window_size, 'hps', analyses, decimation, gate=False, precision=precision)
+        engine.options['hps'] = {'refinement': refinement}
+        engine.detector = None
+        engine.configure()
+        live = np.array([result.frequency for result in engine.process(samples)])
+        offline = analyse_signal(decimate(samples, engine), engine.plan, engine.hop_size, refinement)
+        if len(live) != len(offline) or not np.array_equal(live, offline):
+            difference = np.abs(live - offline).max() if len(live) == len(offline) else None
+            mismatches.append(f"window {window_size} rate {analyses} {refinement} {precision} decimation {decimation}: "
+                              f"{len(live)} live frames, {len(offline)} offline, largest difference {difference}")
+    return mismatches
+
+
+def decimate(samples: np.ndarray, engine: PitchEngine) -> np.ndarray:
+    # the samples as the engine's analysis buffer gets them, in one go
+    return Decimator(engine.factor(), dtype=engine.plan.dtype).process(samples)
+
+
+def compare(results: dict, baseline: dict):
+    # settings that got slower or less accurate than in baseline
+    previous = {setting_key(item): item for item in baseline['results']}
+    regressions = []
+    for item in results['results']:
+        old = previous.get(setting_key(item))
+        if old is None:
+            continue
+        if item['throughput'] < old['throughput'] * (1 - TOLERANCE):
+            regressions.append(f"{setting_key(item)} throughput {old['throughput']:.1f} -> {item['throughput']:.1f}")
+        for name, case in item['cases'].items():
+            before = old['cases'].get(name)
+            if before is None:
+                continue
+            if case['wrong'] > before['wrong'] + 0.01:
+                regressions.append(f"{setting_key(item)} {name} wrong notes {before['wrong']:.3f} -> {case['wrong']:.3f}")
+            if case['median_cents'] is not None and before['median_cents'] is not None and \
+                    case['median_cents'] > before['median_cents'] * (1 + TOLERANCE) + 0.01:
+                regressions.append(
+                    f"{setting_key(item)} {name} median cents {before['median_cents']:.3f} -> {case['median_cents']:.3f}")
+    return regressions
+
+
+def setting_key(item: dict):
+    # runs from before the precision and decimation settings were all
+    # double and undecimated
+    return (f"{item['detector']} chunk {item['chunk_size']} buffer {item['buffer_size']} "
+            f"harmonics {item['harmonics']} {item.get('precision', 'double')} "
+            f"decimation {item.get('decimation', 1)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="latency, throughput and accuracy of the pitch pipeline")
+    parser.add_argument('-o', '--output', default='benchmark.json')
+    parser.add_argument('-c', '--compare', default=None, help="an earlier output, regressions are reported")
+    parser.add_argument('-d', '--detector', default=PitchEngine.DETECTOR)
+    parser.add_argument('-s', '--seconds', type=float, default=1.0, help="length of every signal")
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=CHUNK_SIZES)
+    parser.add_argument('--buffer-sizes', type=int, nargs='+', default=BUFFER_SIZES)
+    parser.add_argument('--harmonics', type=int, nargs='+', default=HARMONICS)
+    parser.add_argument('--precisions', nargs='+', choices=PRECISIONS, default=PRECISIONS)
+    parser.add_argument('--decimations', type=int, nargs='+', default=DECIMATIONS)
+    parser.add_argument('--verify', action='store_true', help="only check the offline path against the live one")
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        mismatches = verify(args.seconds, args.precisions)
+        for mismatch in mismatches:
+            logger.warning("offline differs from live: %s", mismatch)
+        if not mismatches:
+            logger.info("offline and live agree")
+        return 1 if mismatches else 0
+
+    signals = list(cases(args.seconds, np.random.default_rng(SEED)))
+    results = {
+        'version': VERSION,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'sample_rate': SAMPLE_RATE,
+        'seed': SEED,
+        'seconds': args.seconds,
+        'results': [],
+    }
+    settings = itertools.product(args.chunk_sizes, args.buffer_sizes, args.harmonics, args.precisions, args.decimations)
+    for chunk_size, window_size, harmonics, precision, decimation in settings:
+        factor = PitchEngine(SAMPLE_RATE, window_size, args.detector, decimation=decimation).factor()
+        if window_size * factor >= args.seconds * SAMPLE_RATE:
+            logger.warning("window %s at decimation %s is longer than the signals, skipped", window_size, factor)
+            continue
+        result = run(chunk_size, window_size, harmonics, precision, decimation, args.detector, signals)
+        results['results'].append(result)
+        wrong = max(case['wrong'] for case in result['cases'].values())
+        logger.info("%s: %.1f x realtime, p95 %.2f ms per frame, at most %.1f%% wrong notes",
+                    setting_key(result), result['throughput'], result['latency_ms']['p95'], wrong * 100)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    logger.info("results written to %s", args.output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file))
+        for regression in regressions:
+            logger.warning("regression: %s", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,385 @@
+# coding=utf-8
+
+import time
+
+import shiboken6
+
+import utils
+from utils import *
+from plotdata import log_position, MinMaxEnvelope, LogSpectrumBins
+from stats import stats
+
+
+def polygon_buffer(size: int):
+    # a QPolygonF and a (size, 2) float64 numpy view on its points,
+    # writing into the view updates the polygon without any python objects
+    # References:
+    # https://github.com/pyqtgraph/pyqtgraph/blob/master/pyqtgraph/functions.py
+    polygon = QtGui.QPolygonF()
+    polygon.resize(size)
+    address = polygon.data() if size else 0
+    buffer = shiboken6.VoidPtr(address, size * 16, True)
+    points = np.frombuffer(buffer, np.float64).reshape(size, 2)
+    return polygon, points
+
+
+def pen(color: str, alpha: float = 1.0, width: float = 1.0):
+    # anything wider than a pixel sends antialiased polylines down a stroker
+    # that costs 100x more on dense data, and holds the GIL all along
+    color = QtGui.QColor(color)
+    color.setAlphaF(alpha)
+    pen = QtGui.QPen(color)
+    pen.setWidthF(width)
+    # the painter is scaled to the widget, keep the width in pixels
+    pen.setCosmetic(True)
+    return pen
+
+
+class PainterCanvas(QtWidgets.QWidget):
+
+    # Drawn with QPainter straight from preallocated point buffers,
+    # every item is kept in axes coordinates (0 to 1, y down) and the
+    # painter is scaled to the widget, so a resize never touches the data.
+
+    BACKGROUND = QtGui.QColor(204, 204, 204)
+    MARGIN = 0.01
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.setAttribute(QtCore.Qt.WA_OpaquePaintEvent)
+        self.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
+        self.stage = 'paint ' + type(self).__name__.replace('Canvas', '').lower()
+        # listener(seconds) is told how long every paint event took
+        self.listener = None
+
+    def columns(self) -> int:
+        # device pixels across, data is reduced to this many columns
+        return max(1, int(self.width() * self.devicePixelRatioF()))
+
+    def redraw(self):
+        # coalesced by qt, painted once on the next event loop pass
+        self.update()
+
+    def paintEvent(self, event) -> None:
+        start = time.perf_counter()
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), self.BACKGROUND)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.scale(max(self.width(), 1), max(self.height(), 1))
+        self.paint(painter)
+        painter.end()
+        duration = time.perf_counter() - start
+        stats.record(self.stage, duration)
+        if self.listener is not None:
+            self.listener(duration)
+
+    def paint(self, painter: QtGui.QPainter):
+        pass
+
+
+class AudioCanvas(PainterCanvas):
+
+    LIMITS = (-32768, 32768)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.pen = pen(utils.PINK)
+        self.envelope = MinMaxEnvelope()
+        self.key = None
+        self.polygon, self.points = polygon_buffer(0)
+        self.values = np.zeros(0)
+
+    def update_data(self, data: np.ndarray):
+        self.envelope.table(len(data), self.columns())
+        if self.key != self.envelope.key:
+            self.key = self.envelope.key
+            x = self.envelope.x
+            self.polygon, self.points = polygon_buffer(len(x))
+            self.points[:, 0] = (x + self.MARGIN) / (1 + 2 * self.MARGIN)
+            self.values = np.zeros(len(x))
+
+        self.envelope(data, self.columns(), out=self.values)
+        low, high = self.LIMITS
+        np.subtract(high, self.values, out=self.points[:, 1])
+        self.points[:, 1] /= high - low
+        self.redraw()
+
+    def paint(self, painter: QtGui.QPainter):
+        painter.setPen(self.pen)
+        painter.drawPolyline(self.polygon)
+
+
+class SpectrumTicksCanvas(PainterCanvas):
+
+    BACKGROUND = QtGui.QColor(255, 255, 255)
+    LOW = 20
+    HIGH = 5000
+    TICK = 4
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.ticks = [(27.5 * 2 ** i) for i in range(8)]
+        self.positions = log_position(np.array(self.ticks), self.LOW, self.HIGH)
+        self.setMinimumHeight(24)
+
+    def paintEvent(self, event) -> None:
+        # text does not scale, this one is drawn in pixels
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), self.BACKGROUND)
+        painter.setPen(QtGui.QColor('black'))
+        font = painter.font()
+        small = QtGui.QFont(font)
+        small.setPointSizeF(font.pointSizeF() * 0.7)
+        metrics = QtGui.QFontMetrics(font)
+
+        painter.drawLine(0, 0, self.width(), 0)
+        for i, position in enumerate(self.positions):
+            x = int(position * self.width())
+            painter.drawLine(x, 0, x, self.TICK)
+            width = metrics.horizontalAdvance('A')
+            y = self.TICK + metrics.ascent()
+            painter.setFont(font)
+            painter.drawText(x - width, y, 'A')
+            painter.setFont(small)
+            painter.drawText(x, y + metrics.descent(), str(i))
+        painter.end()
+
+
+class SpectrumCanvas(PainterCanvas):
+
+    LOW = 20
+    HIGH = 5000
+    LIMITS = (-0.1, 1.1)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.spectrum_pen = pen(utils.PINK, 0.7)
+        self.optimized_pen = pen(utils.BLUE, 0.5)
+        self.bar_color = QtGui.QColor(utils.GREEN)
+        self.bins = LogSpectrumBins(self.LOW, self.HIGH)
+        self.key = None
+        self.spectrum, self.spectrum_points = polygon_buffer(0)
+        self.optimized, self.optimized_points = polygon_buffer(0)
+        self.values = np.zeros(0)
+        self.bar = QtCore.QRectF()
+
+    def set_columns(self):
+        x = self.bins.x
+        self.spectrum, self.spectrum_points = polygon_buffer(len(x))
+        self.optimized, self.optimized_points = polygon_buffer(len(x))
+        self.spectrum_points[:, 0] = x
+        self.optimized_points[:, 0] = x
+        self.values = np.zeros(len(x))
+
+    def to_y(self, values: np.ndarray, out: np.ndarray):
+        low, high = self.LIMITS
+        np.subtract(high, values, out=out)
+        out /= high - low
+
+    def update_data(self, frequencies: np.ndarray, spectrum: np.ndarray, optimized: np.ndarray, frequency: float):
+        if frequency > 5000:
+            return
+
+        width = 0
+        if frequency > 50:
+            optimized.fill(0.0)
+            width = frequency / 50
+
+        if spectrum.max() > 0:
+            spectrum /= spectrum.max()
+        if optimized.max() > 0:
+            optimized /= optimized.max()
+
+        columns = self.columns()
+        self.bins.table(frequencies, columns)
+        if self.key != self.bins.key:
+            self.key = self.bins.key
+            self.set_columns()
+        self.to_y(self.bins(frequencies, spectrum, columns, out=self.values), self.spectrum_points[:, 1])
+        self.to_y(self.bins(frequencies, optimized, columns, out=self.values), self.optimized_points[:, 1])
+
+        left, right = log_position(np.array([frequency - width / 2, frequency + width / 2]), self.LOW, self.HIGH)
+        top, bottom = (self.LIMITS[1] - np.array([1, 0])) / (self.LIMITS[1] - self.LIMITS[0])
+        self.bar = QtCore.QRectF(left, top, right - left, bottom - top)
+        self.redraw()
+
+    def paint(self, painter: QtGui.QPainter):
+        painter.setPen(self.spectrum_pen)
+        painter.drawPolyline(self.spectrum)
+        painter.setPen(self.optimized_pen)
+        painter.drawPolyline(self.optimized)
+        painter.fillRect(self.bar, self.bar_color)
+
+
+class CentBar(PainterCanvas):
+
+    LIMITS = (-50.1, 50.1)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.color = QtGui.QColor(utils.PINK)
+        self.bar = QtCore.QRectF()
+        self.setMinimumHeight(8)
+
+    def update_data(self, data):
+        low, high = self.LIMITS
+        zero = -low / (high - low)
+        self.bar = QtCore.QRectF(zero, 0, data / (high - low), 1).normalized()
+        if data < -10:
+            self.color = QtGui.QColor(utils.PURPLE)
+        elif data > 10:
+            self.color = QtGui.QColor(utils.RED)
+        else:
+            self.color = QtGui.QColor(utils.GREEN)
+        self.redraw()
+
+    def paint(self, painter: QtGui.QPainter):
+        painter.fillRect(self.bar, self.color)
+
+
+def color_table(stops, count: int = 256):
+    # a colour lookup table through the given colours, evenly spaced
+    colors = np.array([QtGui.QColor(color).getRgb()[:3] for color in stops], dtype=float)
+    positions = np.linspace(0, 1, len(stops))
+    steps = np.linspace(0, 1, count)
+    channels = [np.interp(steps, positions, colors[:, i]).astype(int) for i in range(3)]
+    return [QtGui.qRgb(r, g, b) for r, g, b in zip(*channels)]
+
+
+class SpectrogramCanvas(PainterCanvas):
+
+    # Waterfall of the last log frequency spectra, newest at the top, on the
+    # same axis as SpectrumCanvas. The history is an 8 bit indexed QImage
+    # used as a ring: a timer moves the offset by one row every 1 / rate
+    # seconds of wall clock, a frame writes its colour indexes into the newest
+    # row, the painter draws the ring in two pieces, nothing older is ever
+    # touched again. Colours come from the image colour table. Rows nothing
+    # came for repeat the last spectrum for HOLD seconds, dropped or gated
+    # frames of a note, and are blank after, silence.
+
+    LOW = 20
+    HIGH = 5000
+    ROWS = 300
+    RATE = 30
+    HOLD = 0.5
+    RANGE_DB = 60.0
+    # per frame, the reference level follows loud input at once and decays slowly
+    DECAY_DB = 0.05
+    COLORS = ['#cccccc', utils.BLUE, utils.PURPLE, utils.PINK, utils.YELLOW]
+
+    def __init__(self, rows: int = ROWS, rate: float = RATE) -> None:
+        super().__init__()
+        self.table = color_table(self.COLORS)
+        self.bins = LogSpectrumBins(self.LOW, self.HIGH)
+        self.key = None
+        self.lookup = np.zeros(0, dtype=int)
+        self.values = np.zeros(0)
+        self.levels = np.zeros(0, dtype=np.uint8)
+        self.reference = 0.0
+        self.rows = rows
+        self.rate = rate
+        # perf_counter of the newest row and of the last spectrum
+        self.time = time.perf_counter()
+        self.updated = -np.inf
+        self.set_image(1)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.timer.timeout.connect(self.advance)
+        self.timer.setInterval(int(1000 / rate))
+        self.timer.start()
+
+    def set_rows(self, rows: int, rate: float):
+        self.rate = rate
+        self.timer.setInterval(int(1000 / rate))
+        if rows != self.rows:
+            self.rows = rows
+            self.set_image(self.image.width())
+
+    def set_image(self, columns: int):
+        # a new size starts an empty history
+        self.image = QtGui.QImage(columns, self.rows, QtGui.QImage.Format_Indexed8)
+        self.image.setColorTable(self.table)
+        self.image.fill(0)
+        stride = self.image.bytesPerLine()
+        self.pixels = np.frombuffer(self.image.bits(), np.uint8).reshape(self.rows, stride)[:, :columns]
+        self.row = 0
+        self.filled = 0
+        # blank rows at the top, once the whole history is blank nothing moves
+        self.blank = self.rows
+
+    def advance(self):
+        # the rows due since the newest one, at most a whole history
+        now = time.perf_counter()
+        due = int((now - self.time) * self.rate)
+        if due <= 0:
+            return
+        self.time += due / self.rate
+        if due >= self.rows:
+            due = self.rows
+            self.time = now
+        hold = now - self.updated <= self.HOLD
+        if not hold and self.blank >= self.rows:
+            return
+        for _ in range(due):
+            previous, self.row = self.row, (self.row - 1) % self.rows
+            if hold:
+                self.pixels[self.row] = self.pixels[previous]
+            else:
+                self.pixels[self.row] = 0
+        self.blank = 0 if hold else self.blank + due
+        self.filled = min(self.filled + due, self.rows)
+        self.redraw()
+
+    def set_columns(self, columns: int):
+        # every image column shows the group of bins at or left of it
+        groups = np.round(self.bins.x * columns - 0.5).astype(int)
+        self.lookup = np.clip(np.searchsorted(groups, np.arange(columns), side='right') - 1, 0, None)
+        self.values = np.zeros(len(groups))
+        self.levels = np.zeros(len(groups), dtype=np.uint8)
+        if self.image.width() != columns:
+            self.set_image(columns)
+
+    def update_data(self, frequencies: np.ndarray, spectrum: np.ndarray):
+        columns = self.columns()
+        self.bins.table(frequencies, columns)
+        if self.key != self.bins.key:
+            self.key = self.bins.key
+            self.set_columns(columns)
+        if not len(self.values):
+            return
+
+        values = self.bins(frequencies, spectrum, columns, out=self.values)
+        peak = values.max()
+        self.reference = max(peak, self.reference * 10 ** (-self.DECAY_DB / 20))
+        if self.reference <= 0:
+            return
+
+        # dB below the reference, mapped onto the colour table
+        np.maximum(values, self.reference * 1e-10, out=values)
+        values /= self.reference
+        np.log10(values, out=values)
+        values *= 20 * 255 / self.RANGE_DB
+        values += 255
+        np.clip(values, 0, 255, out=values)
+        self.levels[:] = values
+
+        # into the newest row, a second frame within the same row replaces it
+        self.advance()
+        np.take(self.levels, self.lookup, out=self.pixels[self.row])
+        self.updated = time.perf_counter()
+        self.blank = 0
+        self.filled = max(self.filled, 1)
+        self.redraw()
+
+    def paint(self, painter: QtGui.QPainter):
+        # rows from the offset down are newest to oldest, then the ring wraps
+        width = self.image.width()
+        height = 1 / self.rows
+        first = min(self.rows - self.row, self.filled)
+        second = self.filled - first
+        painter.drawImage(QtCore.QRectF(0, 0, 1, first * height), self.image,
+                          QtCore.QRectF(0, self.row, width, first))
+        if second:
+            painter.drawImage(QtCore.QRectF(0, first * height, 1, second * height), self.image,
+                              QtCore.QRectF(0, 0, width, second))
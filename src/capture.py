@@ -0,0 +1,298 @@
+# coding=utf-8
+
+import os
+import re
+import time
+import logging
+import threading
+import concurrent.futures
+
+import numpy as np
+
+from logger import logger, RateLimit
+from ringbuffer import ConsumerBuffer
+from stats import stats
+from readers import open_reader
+from recorder import Recorder, Recording, SUFFIX
+from sources import (
+    pyaudio, AudioSource, PortAudioSource, BlockingSource,
+    FileSource, SyntheticSource, ReplaySource, INPUT_OVERFLOW,
+)
+
+
+class Capture(object):
+
+    # One running source and the consumers reading it. The callback writes
+    # every chunk to each consumer's ring and returns, it never waits on a
+    # consumer.
+
+    def __init__(self, info: dict, source: AudioSource) -> None:
+        self.info = info
+        self.source = source
+        self.name = source.name
+        self.sample_rate = source.sample_rate
+        # replaced, never changed in place, the callback iterates it unlocked
+        self.consumers = ()
+        self.running = False
+        # raw chunks as they come, for replay
+        self.recorder = None
+
+        self.callback_log = RateLimit(5.0)
+        self.overflow_log = RateLimit(5.0, logging.WARNING)
+        source.backlog = self.backlog
+
+    @property
+    def block_size(self):
+        return self.source.block_size
+
+    def open(self):
+        logger.info("open capture %s, %s Hz, %s block", self.name, self.sample_rate, self.block_size)
+        self.source.start(self.callback)
+        self.running = True
+
+    def close(self):
+        if not self.running:
+            return
+        logger.info("close capture %s", self.name)
+        self.running = False
+        self.source.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def reopen(self, block_size: int):
+        # the recording goes on
+        self.source.stop()
+        self.source.block_size = block_size
+        self.source.start(self.callback)
+
+    def backlog(self) -> int:
+        # samples the slowest consumer has still to read
+        return max((consumer.pending() for consumer in self.consumers), default=0)
+
+    def record(self, path: str):
+        self.recorder = Recorder(path, self.sample_rate, self.block_size)
+
+    def attach(self, consumer: ConsumerBuffer):
+        if consumer not in self.consumers:
+            self.consumers = self.consumers + (consumer,)
+
+    def detach(self, consumer: ConsumerBuffer):
+        self.consumers = tuple(item for item in self.consumers if item is not consumer)
+
+    def callback(self, chunk: np.ndarray, time_info: dict, status: int):
+        # on the source's thread, the consumers copy the chunk into their rings
+        with stats.time('callback'):
+            self.callback_log("input chunk of %s samples, status %s", len(chunk), status)
+            if status & INPUT_OVERFLOW:
+                stats.count('input overflow')
+                self.overflow_log("input overflow on %s", self.name)
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.write(chunk, time_info, status)
+            for consumer in self.consumers:
+                consumer.write(chunk)
+
+
+class CaptureHub(object):
+
+    # Opens every input device once however many views read it, and closes
+    # it when the last of them lets go. PortAudio is initialized on first use,
+    # without it there are only the VIRTUAL devices, files and test signals.
+    # The methods are safe to call from any thread, but opening a device or
+    # listing them can take a while: views submit() them instead, they run
+    # one at a time on the hub's own thread and return a future.
+
+    # 'callback' or 'blocking' PortAudio streams
+    MODE = 'callback'
+
+    def __init__(self, mode: str = MODE) -> None:
+        self.mode = mode
+        self.pyaudio = None
+        # info of the devices that are not PortAudio's, by index
+        self.virtual = {}
+        # device index -> Capture
+        self.captures = {}
+        # a capture opened before anybody asked for it, at most one
+        self.warm = None
+        # [(host api info, [input device info, ...]), ...]
+        self.inputs = None
+        # a directory every capture opened is recorded to, None records nothing
+        self.recordings = None
+        self.executor = None
+        self.lock = threading.RLock()
+
+    @property
+    def audio(self):
+        # None without PortAudio
+        if self.pyaudio is None and pyaudio is not None:
+            self.pyaudio = pyaudio.PyAudio()
+        return self.pyaudio
+
+    def add_file(self, path: str, speed: float = 1.0, loop: bool = True) -> dict:
+        # a file listed with the devices and played as one, recordings are
+        # replayed chunk for chunk
+        if path.endswith(SUFFIX):
+            source, sample_rate = 'replay', Recording(path).sample_rate
+        else:
+            source, sample_rate = 'file', open_reader(path)[0]
+        return self.add_virtual({
+            'name': os.path.basename(path), 'index': f'file:{path}', 'defaultSampleRate': float(sample_rate),
+            'maxInputChannels': 1, 'source': source, 'path': path, 'speed': speed, 'loop': loop,
+        })
+
+    def add_synthetic(self, sample_rate: int = 44100, **options) -> dict:
+        # options as SyntheticSource takes them
+        name = f"synthetic {options.get('frequency', 440):g} Hz"
+        return self.add_virtual({
+            'name': name, 'index': f'synthetic:{len(self.virtual)}', 'defaultSampleRate': float(sample_rate),
+            'maxInputChannels': 1, 'source': 'synthetic', 'options': options,
+        })
+
+    def add_virtual(self, info: dict) -> dict:
+        with self.lock:
+            self.virtual[info['index']] = info
+            # listed again next time
+            self.inputs = None
+        return info
+
+    def create_source(self, info: dict, block_size: int) -> AudioSource:
+        source = info.get('source')
+        if source == 'file':
+            return FileSource(info['path'], block_size, info.get('speed', 1.0), info.get('loop', True))
+        if source == 'replay':
+            return ReplaySource(info['path'], info.get('speed', 1.0), info.get('loop', True))
+        if source == 'synthetic':
+            return SyntheticSource(int(info.get('defaultSampleRate')), block_size, **info.get('options', {}))
+        if self.audio is None:
+            raise OSError(f"no PortAudio to open {info.get('name')}")
+        if self.mode == 'blocking':
+            return BlockingSource(self.audio, info, block_size)
+        return PortAudioSource(self.audio, info, block_size)
+
+    def submit(self, function, *args) -> concurrent.futures.Future:
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='CaptureHub')
+            return self.executor.submit(function, *args)
+
+    def devices(self, refresh: bool = False):
+        # the input devices of every host api, listed once and cached
+        with self.lock:
+            if refresh and self.pyaudio is not None and not self.captures:
+                # PortAudio only sees devices plugged in since once it is
+                # initialized again, which would kill the open streams
+                self.pyaudio.terminate()
+                self.pyaudio = None
+            if self.inputs is None or refresh:
+                self.inputs = self.enumerate()
+            return self.inputs
+
+    def enumerate(self):
+        inputs = []
+        audio = self.audio
+        for i in range(audio.get_host_api_count() if audio is not None else 0):
+            api = audio.get_host_api_info_by_index(i)
+            devices = []
+            for j in range(api.get('deviceCount')):
+                info = audio.get_device_info_by_host_api_device_index(i, j)
+                if info.get('maxInputChannels') > 0:
+                    devices.append(info)
+            inputs.append((api, devices))
+        if self.virtual or audio is None:
+            if audio is None and not self.virtual:
+                # something to look at on machines without audio
+                self.add_synthetic()
+            inputs.append(({'name': 'Virtual', 'index': -1, 'deviceCount': len(self.virtual)},
+                           list(self.virtual.values())))
+        return inputs
+
+    def start(self, info: dict, block_size: int, consumer: ConsumerBuffer = None) -> Capture:
+        # the consumer is attached before the source runs, it gets every chunk
+        capture = Capture(info, self.create_source(info, block_size))
+        if consumer is not None:
+            capture.attach(consumer)
+        if self.recordings is not None:
+            name = re.sub(r'[^\w.-]+', '_', capture.name)
+            capture.record(os.path.join(self.recordings, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}{SUFFIX}"))
+        try:
+            capture.open()
+        except Exception:
+            if capture.recorder is not None:
+                # nothing was recorded
+                capture.recorder.close()
+                os.remove(capture.recorder.path)
+            raise
+        return capture
+
+    def open(self, info: dict, block_size: int, consumer: ConsumerBuffer) -> Capture:
+        # raises OSError when the device can not be opened
+        with self.lock:
+            index = info.get('index')
+            capture = self.captures.get(index)
+            if capture is not None and capture.block_size != block_size:
+                # one block size per device, the latest request wins
+                try:
+                    capture.reopen(block_size)
+                except OSError:
+                    del self.captures[index]
+                    raise
+            if capture is None:
+                capture = self.start(info, block_size, consumer)
+                self.captures[index] = capture
+            if capture is self.warm:
+                self.warm = None
+            capture.attach(consumer)
+            return capture
+
+    def preopen(self, info: dict, block_size: int):
+        # opens a device ahead of time, switching to it is then only an attach
+        with self.lock:
+            index = info.get('index')
+            warm, self.warm = self.warm, None
+            if warm is not None and warm.info.get('index') != index:
+                self.close_idle(warm)
+            capture = self.captures.get(index)
+            if capture is None:
+                try:
+                    capture = self.start(info, block_size)
+                except OSError as e:
+                    logger.warning("can not open %s ahead: %s", info.get('name'), e)
+                    return None
+                self.captures[index] = capture
+            if not capture.consumers:
+                self.warm = capture
+            return capture
+
+    def release(self, consumer: ConsumerBuffer):
+        # detaches the consumer from whatever it reads
+        with self.lock:
+            for capture in list(self.captures.values()):
+                capture.detach(consumer)
+                if capture is not self.warm:
+                    self.close_idle(capture)
+
+    def close_idle(self, capture: Capture):
+        if capture.consumers:
+            return
+        capture.close()
+        if self.captures.get(capture.info.get('index')) is capture:
+            del self.captures[capture.info.get('index')]
+
+    def terminate(self):
+        # after the calls already submitted
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        with self.lock:
+            for capture in self.captures.values():
+                capture.close()
+            self.captures = {}
+            self.warm = None
+            self.inputs = None
+            if self.pyaudio is not None:
+                self.pyaudio.terminate()
+                self.pyaudio = None
+
+
+hub = CaptureHub()
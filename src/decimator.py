@@ -0,0 +1,54 @@
+# coding=utf-8
+
+import numpy as np
+import scipy.signal as scisignal
+
+
+class Decimator(object):
+
+    # Streaming anti alias low pass + downsample by an integer factor.
+    # Only every factor-th output of the FIR is evaluated (polyphase cost,
+    # taps_per_phase multiplies per input sample), and the filter history
+    # and the output phase are carried across chunks, so consecutive
+    # chunks produce exactly the same samples as one long signal would.
+
+    TAPS_PER_PHASE = 48
+
+    def __init__(self, factor: int = 1, taps_per_phase: int = TAPS_PER_PHASE, dtype=np.float64) -> None:
+        self.factor = int(factor)
+        if self.factor < 1:
+            raise ValueError(f"invalid decimation factor {factor}")
+
+        self.taps = np.ones(1)
+        if self.factor > 1:
+            # cutoff at the new nyquist frequency, relative to the old one
+            self.taps = scisignal.firwin(taps_per_phase * self.factor, 1. / self.factor)
+        # reversed, so a window of inputs dotted with it is one output sample
+        self.kernel = self.taps[::-1].astype(dtype)
+
+        self.dtype = np.dtype(dtype)
+        self.history = np.zeros(len(self.taps) - 1, dtype=self.dtype)
+        self.work = np.zeros(0, dtype=self.dtype)
+        self.phase = 0
+
+    def reset(self):
+        self.history.fill(0)
+        self.phase = 0
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        if self.factor == 1:
+            return chunk
+
+        count = len(chunk)
+        keep = len(self.history)
+        if len(self.work) != keep + count:
+            self.work = np.zeros(keep + count, dtype=self.dtype)
+        self.work[:keep] = self.history
+        self.work[keep:] = chunk
+
+        windows = np.lib.stride_tricks.sliding_window_view(self.work, len(self.kernel))
+        output = windows[self.phase::self.factor] @ self.kernel
+
+        self.history[:] = self.work[count:]
+        self.phase = (self.phase - count) % self.factor
+        return output
@@ -0,0 +1,300 @@
+# coding=utf-8
+
+import time
+
+import numpy as np
+import scipy.fft as scifft
+
+from analysis import HarmonicProductSpectrumPlan, interpolate_peak, harmonic_score, zoom_peak
+from ringbuffer import RingBuffer
+
+
+DETECTORS = {}
+
+
+def register(cls):
+    DETECTORS[cls.name] = cls
+    return cls
+
+
+def create_detector(name: str, plan: HarmonicProductSpectrumPlan, **kwargs):
+    if name not in DETECTORS:
+        raise ValueError(f"unknown pitch detector {name}, choose from {list(DETECTORS)}")
+    return DETECTORS[name](plan, **kwargs)
+
+
+class Detector(object):
+
+    # A pitch estimator bound to one analysis plan (sample rate and window size).
+    # detect() gets the latest unwindowed samples and the number of samples
+    # since the previous call, and returns (frequency, confidence) with the
+    # confidence between 0 and 1. Calling the detector times detect(),
+    # cost is the smoothed per frame cost in seconds.
+
+    name = None
+    # True if detect() already ran the plan, so the spectrum is up to date
+    spectral = False
+
+    MIN_FREQUENCY = 27.5
+    MAX_FREQUENCY = 5000
+    # samples per period of MAX_FREQUENCY the detector needs, this caps the
+    # decimation, the spectral ones only need nyquist
+    SAMPLES_PER_PERIOD = 2
+    SMOOTHING = 0.9
+
+    def __init__(self, plan: HarmonicProductSpectrumPlan) -> None:
+        self.plan = plan
+        self.sample_rate = plan.sample_rate
+        self.size = plan.size
+        self.cost = 0.0
+        self.last_cost = 0.0
+        self.frames = 0
+
+    def __call__(self, samples: np.ndarray, hop: int = 0):
+        start = time.perf_counter()
+        result = self.detect(samples, hop)
+        self.last_cost = time.perf_counter() - start
+        if self.frames:
+            self.cost = self.cost * self.SMOOTHING + self.last_cost * (1 - self.SMOOTHING)
+        else:
+            self.cost = self.last_cost
+        self.frames += 1
+        return result
+
+    def feed(self, chunk: np.ndarray):
+        # every chunk that enters the window, for detectors with incremental state
+        pass
+
+    def detect(self, samples: np.ndarray, hop: int = 0):
+        raise NotImplementedError
+
+
+@register
+class HarmonicProductSpectrumDetector(Detector):
+
+    name = 'hps'
+    spectral = True
+
+    def __init__(self, plan: HarmonicProductSpectrumPlan, refinement: str = 'phase') -> None:
+        super().__init__(plan)
+        self.refinement = refinement
+        self.windowed = np.zeros(self.size, dtype=plan.dtype)
+
+    def detect(self, samples: np.ndarray, hop: int = 0):
+        np.multiply(samples, self.plan.window, out=self.windowed)
+        spectrum, optimized = self.plan.process(self.windowed)
+        frequency = self.plan.peak(self.refinement, hop)
+
+        # share of the spectral energy that sits on the first harmonics
+        power = spectrum * spectrum
+        total = power.sum()
+        if total <= 0:
+            return frequency, 0.0
+        index = int(round(frequency / self.plan.resolution))
+        harmonic = 0.0
+        for h in range(1, self.plan.harmonics + 1):
+            center = index * h
+            if center >= self.plan.bins:
+                break
+            harmonic += power[max(center - 1, 0):center + 2].sum()
+        return frequency, min(harmonic / total, 1.0)
+
+
+@register
+class YinDetector(Detector):
+
+    # References:
+    # de Cheveigne, Kawahara, YIN, a fundamental frequency estimator for speech and music, 2002
+
+    name = 'yin'
+    THRESHOLD = 0.15
+    # lags a few samples long are too coarse, the device rate only
+    SAMPLES_PER_PERIOD = 8
+
+    def __init__(self, plan: HarmonicProductSpectrumPlan, threshold: float = THRESHOLD) -> None:
+        super().__init__(plan)
+        self.threshold = threshold
+        # integration window, lags up to size - integration
+        self.integration = self.size // 2
+        self.min_tau = max(2, int(self.sample_rate / self.MAX_FREQUENCY))
+        self.max_tau = min(self.size - self.integration, int(self.sample_rate / self.MIN_FREQUENCY) + 2)
+        self.taus = np.arange(self.max_tau + 1)
+        # x[:integration] against x, lags below size - integration never wrap
+        self.nfft = scifft.next_fast_len(self.size, real=True)
+        self.energy = np.zeros(self.size + 1)
+
+    def detect(self, samples: np.ndarray, hop: int = 0):
+        w = self.integration
+        taus = self.taus
+        np.cumsum(samples * samples, out=self.energy[1:])
+        energy = self.energy
+        if energy[-1] <= 0:
+            return 0.0, 0.0
+
+        correlation = scifft.irfft(
+            np.conj(scifft.rfft(samples[:w], self.nfft)) * scifft.rfft(samples, self.nfft),
+            self.nfft)[:self.max_tau + 1]
+
+        # difference function d(tau) = sum (x[j] - x[j + tau]) ** 2
+        difference = energy[w] + energy[taus + w] - energy[taus] - 2 * correlation
+        difference[0] = 0
+
+        # cumulative mean normalized difference
+        total = np.cumsum(difference)
+        total[total <= 0] = 1
+        cmndf = difference * taus / total
+        cmndf[0] = 1
+
+        search = cmndf[self.min_tau:self.max_tau]
+        below = np.flatnonzero(search < self.threshold)
+        if len(below):
+            tau = self.min_tau + int(below[0])
+            while tau + 1 < self.max_tau and cmndf[tau + 1] < cmndf[tau]:
+                tau += 1
+        else:
+            tau = self.min_tau + int(np.argmin(search))
+
+        offset = interpolate_peak(-cmndf[tau - 1:tau + 2], 1, False)
+        frequency = self.sample_rate / (tau + offset)
+        return frequency, float(np.clip(1 - cmndf[tau], 0, 1))
+
+
+@register
+class McLeodDetector(Detector):
+
+    # References:
+    # McLeod, Wyvill, A smarter way to find pitch, 2005
+
+    name = 'mpm'
+    CUTOFF = 0.9
+    SAMPLES_PER_PERIOD = 8
+
+    def __init__(self, plan: HarmonicProductSpectrumPlan, cutoff: float = CUTOFF) -> None:
+        super().__init__(plan)
+        self.cutoff = cutoff
+        self.max_tau = min(self.size - 1, int(self.sample_rate / self.MIN_FREQUENCY) + 2)
+        self.taus = np.arange(self.max_tau + 1)
+        # linear autocorrelation needs twice the window
+        self.nfft = scifft.next_fast_len(self.size * 2, real=True)
+        self.energy = np.zeros(self.size + 1)
+
+    def detect(self, samples: np.ndarray, hop: int = 0):
+        taus = self.taus
+        np.cumsum(samples * samples, out=self.energy[1:])
+        energy = self.energy
+
+        transform = scifft.rfft(samples, self.nfft)
+        power = transform.real * transform.real + transform.imag * transform.imag
+        correlation = scifft.irfft(power, self.nfft)[:self.max_tau + 1]
+
+        # normalized square difference function
+        norm = energy[self.size - taus] + energy[self.size] - energy[taus]
+        norm[norm <= 0] = np.inf
+        nsdf = 2 * correlation / norm
+
+        # key maxima, the highest point between a positive zero crossing and the next one
+        positive = nsdf[:self.max_tau] > 0
+        negative = np.flatnonzero(~positive)
+        if not len(negative):
+            return 0.0, 0.0
+        rises = np.flatnonzero(positive[1:] & ~positive[:-1]) + 1
+        rises = rises[rises > negative[0]]
+        if not len(rises):
+            return 0.0, 0.0
+        maxima = np.maximum.reduceat(nsdf[:self.max_tau], rises)
+
+        index = int(np.flatnonzero(maxima >= self.cutoff * maxima.max())[0])
+        end = rises[index + 1] if index + 1 < len(rises) else self.max_tau
+        tau = int(rises[index] + np.argmax(nsdf[rises[index]:end]))
+
+        offset = interpolate_peak(nsdf, tau, False)
+        frequency = self.sample_rate / (tau + offset)
+        return frequency, float(np.clip(nsdf[tau], 0, 1))
+
+
+@register
+class SlidingDFTDetector(Detector):
+
+    # A bank of sliding DFT resonators at the 88 piano keys and their harmonics.
+    # feed() updates every resonator with each incoming chunk at a cost of
+    # O(chunk * resonators), independent of the window length, and detect()
+    # picks the key from the resonators and only fine tunes around that key
+    # with a small zoom DFT of the windowed samples.
+    # Each resonator integrates over Q periods (at most the window), so its
+    # bandwidth is about one key wide at every pitch.
+
+    # References:
+    # Jacobsen, Lyons, The sliding DFT, IEEE Signal Processing Magazine, 2003
+
+    name = 'sdft'
+    KEYS = 88
+    A0 = 27.5
+    Q = 17
+    ZOOM_CENTS = 50
+    ZOOM_STEP = 10
+    ZOOM_POINTS = 64
+    # longest run of samples slid at once, the tables are resonators x SLIDE
+    SLIDE = 1024
+
+    def __init__(self, plan: HarmonicProductSpectrumPlan) -> None:
+        super().__init__(plan)
+        self.keys = self.A0 * 2 ** (np.arange(self.KEYS) / 12)
+        self.harmonics = np.arange(1, plan.harmonics + 1)
+        frequencies = self.keys[:, None] * self.harmonics
+        self.valid = frequencies < self.sample_rate / 2
+        self.omega = (2 * np.pi * frequencies / self.sample_rate).ravel()
+        self.lengths = np.minimum(self.size, np.ceil(self.Q * self.sample_rate / frequencies.ravel())).astype(int)
+        # phase of a sample leaving a resonator relative to one entering it
+        self.leaving = np.exp(1j * self.omega * self.lengths)
+
+        self.sums = np.zeros(len(self.omega), dtype=np.complex128)
+        self.history = RingBuffer(self.size)
+        self.slide_size = min(self.size, self.SLIDE)
+        self.extended = np.zeros(self.size + self.slide_size)
+        self.windowed = np.zeros(self.size)
+        self.position = 0
+        # cos(wi) and sin(wi) for i in range(slide_size), a shorter slide
+        # takes the first columns, kept real so the products stay real
+        # matrix products
+        angle = np.outer(self.omega, np.arange(self.slide_size))
+        self.cos = np.cos(angle)
+        self.sin = np.sin(angle)
+        # where the samples leaving each resonator start in history + chunk,
+        # the window ends at size
+        self.start = self.size - self.lengths
+
+    def feed(self, chunk: np.ndarray):
+        # whatever the chunk lengths, the tables never grow
+        for start in range(0, len(chunk), self.slide_size):
+            self.slide(chunk[start:start + self.slide_size])
+
+    def slide(self, chunk: np.ndarray):
+        count = len(chunk)
+        cos = self.cos[:, :count]
+        sin = self.sin[:, :count]
+        extended = self.extended[:self.size + count]
+        extended[:self.size] = self.history.view()
+        extended[self.size:] = chunk
+
+        rotation = np.exp(-1j * ((self.omega * self.position) % (2 * np.pi)))
+        entering = cos @ extended[self.size:] - 1j * (sin @ extended[self.size:])
+        gathered = np.lib.stride_tricks.sliding_window_view(extended, count)[self.start]
+        leaving = np.einsum('ri,ri->r', gathered, cos) - 1j * np.einsum('ri,ri->r', gathered, sin)
+        self.sums += (entering - leaving * self.leaving) * rotation
+        self.history.append(chunk)
+        self.position += count
+
+    def detect(self, samples: np.ndarray, hop: int = 0):
+        magnitudes = (np.abs(self.sums) / self.lengths).reshape(self.valid.shape)
+        scores = harmonic_score(magnitudes, self.valid)
+        key = int(np.argmax(scores))
+        if magnitudes[key, 0] <= 0:
+            return 0.0, 0.0
+
+        strength = np.exp(scores * 2)
+        confidence = strength[key] / strength.sum()
+
+        windowed = self.history.read(self.windowed, self.plan.window)
+        frequency = zoom_peak(windowed, self.keys[key], self.sample_rate,
+                              self.ZOOM_CENTS, len(self.harmonics), self.ZOOM_STEP, self.ZOOM_POINTS)
+        return frequency, float(confidence)
@@ -0,0 +1,190 @@
+# coding=utf-8
+
+import typing
+import collections
+
+import numpy as np
+
+from ringbuffer import RingBuffer
+from analysis import HarmonicProductSpectrumPlan
+from decimator import Decimator
+from detectors import DETECTORS, Detector, create_detector
+from gate import ActivityGate
+from stats import stats
+
+
+A0 = 27.5
+KEYS = 88
+NOTENAMES = 'A A# B C C# D D# E F F# G G#'.split(" ")
+
+
+class PitchResult(typing.NamedTuple):
+
+    frequency: float
+    # None outside of the piano range
+    note: typing.Optional[str]
+    octave: int
+    cents: float
+    confidence: float
+
+
+def pitch_result(frequency: float, confidence: float = 0.0) -> PitchResult:
+    if frequency < A0 or frequency > 5000:
+        return PitchResult(frequency, None, 0, 0.0, confidence)
+
+    n = 12 * np.log2(frequency / A0)
+    if n > KEYS or n < 0:
+        return PitchResult(frequency, None, 0, 0.0, confidence)
+
+    cents = (n - round(n)) * 100
+    octave, note = divmod(round(n), 12)
+    if note > 2:  # start with A0 A#0 B0 C1 ...
+        octave += 1
+    return PitchResult(float(frequency), NOTENAMES[note], int(octave), float(cents), float(confidence))
+
+
+class PitchEngine(object):
+
+    # Everything between raw samples and a pitch, without Qt or an audio device:
+    # decimation, the analysis window, the activity gate and the detector.
+    # feed() and analyse() are the two halves the live worker calls on its own
+    # schedule, process() does both for a block of samples and returns one
+    # result per hop. int16 and float (-1 to 1) chunks are both accepted.
+    # An engine is not thread safe, use one per stream.
+
+    WINDOW_SIZE = 20480
+    HARMONICS = 3
+    DETECTOR = 'hps'
+    DETECTOR_OPTIONS = {'hps': {'refinement': 'phase'}}
+    # analyses per second
+    ANALYSIS_RATE = 20
+    DECIMATION = 1
+    GATE = True
+    FULL_SCALE = 32768
+    # the window, the transform and the HPS products in float64 or float32
+    PRECISION = 'double'
+    PRECISIONS = {'double': np.float64, 'single': np.float32}
+    # plans kept for settings switched back to, a plan for a large window
+    # costs a few ms to build and a few hundred kB
+    PLANS = 4
+
+    def __init__(self, sample_rate: int = 44100, window_size: int = WINDOW_SIZE,
+                 detector: str = DETECTOR, analyses: int = ANALYSIS_RATE,
+                 decimation: int = DECIMATION, harmonics: int = HARMONICS,
+                 gate: bool = GATE, spectrum: bool = False, precision: str = PRECISION) -> None:
+        self.sample_rate = sample_rate
+        self.window_size = window_size
+        self.detector_name = detector
+        self.analyses = analyses
+        self.decimation = decimation
+        self.harmonics = harmonics
+        self.precision = precision
+        # keep plan.spectrum up to date whatever the detector, for display
+        self.spectrum = spectrum
+        self.options = dict(self.DETECTOR_OPTIONS)
+
+        self.plan = None
+        self.plans = collections.OrderedDict()
+        self.decimator = None
+        self.buffer = None
+        self.detector = None
+        self.gate = ActivityGate(gate)
+        self.configure()
+
+    def dtype(self):
+        if self.precision not in self.PRECISIONS:
+            raise ValueError(f"unknown precision {self.precision}, choose from {list(self.PRECISIONS)}")
+        return np.dtype(self.PRECISIONS[self.precision])
+
+    def factor(self):
+        # the decimation asked for, as far as the detector still sees the
+        # highest notes with it
+        detector = DETECTORS.get(self.detector_name, Detector)
+        limit = int(self.sample_rate / (detector.SAMPLES_PER_PERIOD * detector.MAX_FREQUENCY))
+        return max(1, min(self.decimation, limit))
+
+    def analysis_rate(self):
+        return self.sample_rate / self.factor()
+
+    def configure(self):
+        # rebuilds what the current settings changed, the window survives
+        # as long as its size does
+        dtype = self.dtype()
+        # the filter taps take a firwin design, its history the stream so far
+        factor = self.factor()
+        if self.decimator is None or self.decimator.factor != factor or self.decimator.dtype != dtype:
+            self.decimator = Decimator(factor, dtype=dtype)
+        key = (self.analysis_rate(), self.window_size, self.harmonics, dtype)
+        if self.plan is None or self.plan.key() != key:
+            self.plan = self.cached_plan(key)
+        if self.buffer is None or len(self.buffer) != self.window_size or self.buffer.dtype != dtype:
+            self.buffer = RingBuffer(self.window_size, dtype)
+            self.windowed = np.zeros(self.window_size, dtype=dtype)
+            self.gate.reset()
+        if self.detector is None or self.detector.plan is not self.plan or self.detector.name != self.detector_name:
+            self.detector = create_detector(self.detector_name, self.plan, **self.options.get(self.detector_name, {}))
+        self.written = self.buffer.written
+
+        self.hop_size = max(1, int(round(self.analysis_rate() / self.analyses)))
+        # in input samples, before decimation
+        self.hop = self.hop_size * factor
+        self.until = self.hop
+
+    def restart(self):
+        # the next chunk does not continue the last one, a new stream
+        self.decimator.reset()
+
+    def cached_plan(self, key):
+        plan = self.plans.pop(key, None)
+        if plan is None:
+            plan = HarmonicProductSpectrumPlan(*key)
+        plan.reset()
+        # most recently used last
+        self.plans[key] = plan
+        while len(self.plans) > self.PLANS:
+            self.plans.popitem(last=False)
+        return plan
+
+    def feed(self, chunk: np.ndarray):
+        # References:
+        # https://github.com/TomSchimansky/GuitarTuner
+        with stats.time('feed'):
+            if chunk.dtype.kind == 'f':
+                chunk = chunk * self.FULL_SCALE
+            samples = self.decimator.process(chunk)
+            self.buffer.append(samples)
+            self.detector.feed(samples)
+
+    def analyse(self) -> typing.Optional[PitchResult]:
+        # None when the gate skips the frame
+        with stats.time('gate'):
+            active = self.gate(self.buffer.view(), self.buffer.written)
+        if not active:
+            stats.count('gated')
+            return None
+
+        # samples since the previous analysis, for the phase vocoder refinement
+        hop = self.buffer.written - self.written
+        self.written = self.buffer.written
+
+        # detect includes the fft, hps and peak stages of the spectral detectors
+        with stats.time('detect'):
+            frequency, confidence = self.detector(self.buffer.view(), hop)
+        if self.spectrum and not self.detector.spectral:
+            self.plan.process(self.buffer.read(self.windowed, self.plan.window))
+        return pitch_result(frequency, confidence)
+
+    def process(self, chunk: np.ndarray) -> typing.List[PitchResult]:
+        results = []
+        while len(chunk):
+            count = min(len(chunk), self.until)
+            self.feed(chunk[:count])
+            chunk = chunk[count:]
+            self.until -= count
+            if self.until:
+                continue
+            self.until = self.hop
+            result = self.analyse()
+            if result is not None:
+                results.append(result)
+        return results
@@ -0,0 +1,103 @@
+# coding=utf-8
+
+import numpy as np
+import scipy.fft as scifft
+
+
+class ActivityGate(object):
+
+    # Decides before each analysis whether it is worth running at all.
+    # Only the samples that arrived since the last check are looked at:
+    # their level against an adaptive noise floor, and the spectral flux
+    # of a small transform against the previous check.
+    #   silent: below the floor, nothing is analysed or drawn
+    #   steady: same level and spectrum, only every STEADY_INTERVAL-th frame is analysed
+    #   onset:  level jump or spectral change, back to full rate at once
+
+    SILENCE_DB = -60.0
+    FLOOR_MARGIN_DB = 6.0
+    # per check, the floor follows quiet input at once, and rises slowly
+    # only while the input stays within the margin above it, never on a
+    # note, and never past FLOOR_MAX_DB, well below playing levels
+    FLOOR_RISE_DB = 0.02
+    FLOOR_MAX_DB = -60.0
+    # a noise bed that came up by more than the margin is learned from the
+    # quietest level of the last FLOOR_WINDOW checks, minimum statistics
+    FLOOR_WINDOW = 200
+    ONSET_DB = 6.0
+    FLUX_THRESHOLD = 0.15
+    STEADY_INTERVAL = 4
+    FULL_SCALE = 32768.0
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.reset()
+        self.checked = 0
+        self.skipped = 0
+        self.silent = 0
+        self.steady = 0
+
+    def reset(self):
+        self.written = 0
+        self.floor = self.SILENCE_DB
+        self.level = self.SILENCE_DB
+        self.levels = np.full(self.FLOOR_WINDOW, np.inf)
+        self.magnitudes = None
+        self.window = None
+        self.since = 0
+
+    def __call__(self, samples: np.ndarray, written: int) -> bool:
+        # samples is the latest window, written the total sample count
+        # of the buffer, returns True if the frame should be analysed
+        if not self.enabled:
+            return True
+        fresh = min(written - self.written, len(samples))
+        self.written = written
+        if fresh <= 0:
+            return False
+
+        self.checked += 1
+        chunk = samples[-fresh:]
+
+        rms = np.sqrt(np.mean(np.square(chunk, dtype=np.float64)))
+        level = 20 * np.log10(max(rms / self.FULL_SCALE, 1e-10))
+        previous, self.level = self.level, level
+        self.levels[self.checked % self.FLOOR_WINDOW] = level
+        if level < self.floor:
+            self.floor = level
+        elif level < self.floor + self.FLOOR_MARGIN_DB:
+            self.floor = min(self.floor + self.FLOOR_RISE_DB, self.FLOOR_MAX_DB)
+        else:
+            self.floor = max(self.floor, min(self.levels.min(), self.FLOOR_MAX_DB))
+
+        if level < max(self.SILENCE_DB, self.floor + self.FLOOR_MARGIN_DB) and level - previous < self.ONSET_DB:
+            self.magnitudes = None
+            self.silent += 1
+            return self.skip()
+
+        flux = self.flux(chunk)
+        if level - previous >= self.ONSET_DB or flux >= self.FLUX_THRESHOLD:
+            self.since = 0
+            return True
+
+        self.since += 1
+        if self.since % self.STEADY_INTERVAL == 0:
+            return True
+        self.steady += 1
+        return self.skip()
+
+    def skip(self):
+        self.skipped += 1
+        return False
+
+    def flux(self, chunk: np.ndarray) -> float:
+        # half wave rectified spectral flux, relative to the current magnitude
+        if self.window is None or len(self.window) != len(chunk):
+            self.window = np.hanning(len(chunk))
+            self.magnitudes = None
+        magnitudes = np.abs(scifft.rfft(chunk * self.window))
+        previous, self.magnitudes = self.magnitudes, magnitudes
+        total = magnitudes.sum()
+        if previous is None or total <= 0:
+            return np.inf
+        return np.maximum(magnitudes - previous, 0).sum() / total
@@ -1,11 +1,113 @@
 # coding=utf-8
 
+import os
 import sys
+import time
+import queue
+import atexit
 import logging
+import logging.handlers
+
+# Records are put on a queue by the thread that logs them and formatted and
+# written by a listener thread, so logging never waits on the console.
+# Levels come from MUSICO_LOG, a default level and per module overrides,
+# modules by file name, for example MUSICO_LOG=info,tuner=debug,worker=warning
+
+FORMAT = '[%(asctime)s][%(filename)s:%(lineno)d][%(levelname)s] %(message)s'
+LEVEL = 'debug'
+LEVELS = {'matplotlib': 'warning'}
+
+
+class ModuleFilter(logging.Filter):
+
+    def __init__(self, levels: dict) -> None:
+        super().__init__()
+        self.levels = levels
+        self.level = logging.DEBUG
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.levels.get(record.module, self.level)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+
+    # the stock handler formats the message in the calling thread,
+    # here the listener does it, the record goes on the queue as it is
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_levels(spec: str):
+    # 'info,tuner=debug' -> (INFO, {'tuner': DEBUG})
+    level = logging.getLevelName(LEVEL.upper())
+    levels = {}
+    for item in filter(None, (item.strip() for item in spec.split(','))):
+        name, _, value = item.rpartition('=')
+        value = logging.getLevelName(value.upper())
+        if not isinstance(value, int):
+            continue
+        if name:
+            levels[name] = value
+        else:
+            level = value
+    return level, levels
+
+
+def configure(spec: str = ''):
+    # called once on import, again to change the levels at run time
+    level, levels = parse_levels(','.join([f'{k}={v}' for k, v in LEVELS.items()] + [spec]))
+    module_filter.level = level
+    module_filter.levels = levels
+    # the logger only lets through what at least one module wants
+    logger.setLevel(min([level] + list(levels.values())))
+    for name, value in levels.items():
+        logging.getLogger(name).setLevel(value)
+
+
+records = queue.SimpleQueue()
+handler = QueueHandler(records)
+module_filter = ModuleFilter({})
+handler.addFilter(module_filter)
+
+console = logging.StreamHandler(sys.stdout)
+console.setFormatter(logging.Formatter(FORMAT))
+listener = logging.handlers.QueueListener(records, console, respect_handler_level=True)
 
-logging.getLogger('matplotlib').setLevel(logging.WARNING)
-logging.basicConfig(
-    stream=sys.stdout,
-    level=logging.DEBUG,
-    format='[%(asctime)s][%(filename)s:%(lineno)d][%(levelname)s] %(message)s',)
 logger = logging.getLogger()
+for old in list(logger.handlers):
+    logger.removeHandler(old)
+logger.addHandler(handler)
+configure(os.environ.get('MUSICO_LOG', ''))
+
+listener.start()
+# flushes whatever is still queued on exit
+atexit.register(listener.stop)
+
+
+class RateLimit(object):
+
+    # A log call that goes through at most once per interval, safe to call
+    # from the audio callback: the check is a clock read and a compare, and
+    # the record itself is only put on the queue. The calls dropped in
+    # between are counted and reported with the next one.
+
+    def __init__(self, interval: float = 1.0, level: int = logging.DEBUG) -> None:
+        self.interval = interval
+        self.level = level
+        self.last = -interval
+        self.suppressed = 0
+
+    def __call__(self, message: str, *args, **kwargs) -> bool:
+        if not logger.isEnabledFor(self.level):
+            return False
+        now = time.monotonic()
+        if now - self.last < self.interval:
+            self.suppressed += 1
+            return False
+        self.last = now
+        if self.suppressed:
+            message += f' ({self.suppressed} more suppressed)'
+            self.suppressed = 0
+        logger.log(self.level, message, *args, stacklevel=2, **kwargs)
+        return True
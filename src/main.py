@@ -13,13 +13,13 @@ from PySide6.QtGui import (
 )
 
 import mido
-import pyaudio
 import numpy as np
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
 from matplotlib.figure import Figure
 
 
 from logger import logger
+from capture import hub
 
 dirname = os.path.dirname(os.path.abspath(__file__))
 assets = os.path.abspath(os.path.join(dirname, "../assets"))
@@ -52,9 +52,8 @@ class MainWindow(QtWidgets.QMainWindow):
         logger.info("Musico is closing...")
         # self.inport.close()
         # self.outport.close()
-        self.stream.stop_stream()
-        self.stream.close()
-        self.audio.terminate()
+        # every view shares the devices through the hub, they all close here
+        hub.terminate()
         return super().closeEvent(event)
 
 
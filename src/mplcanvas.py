@@ -0,0 +1,195 @@
+# coding=utf-8
+
+from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
+from matplotlib.figure import Figure
+
+import utils
+from utils import *
+from logger import logger
+
+
+class MPLCanvas(FigureCanvasQTAgg):
+
+    def __init__(self) -> None:
+        self.figure = Figure()
+        super().__init__(self.figure)
+        self.axes = self.figure.add_subplot(1, 1, 1)
+        self.axes.margins(0.01)
+        self.axes.set_facecolor((0.8, 0.8, 0.8))
+
+        self.axes.spines['top'].set_visible(False)
+        self.axes.spines['right'].set_visible(False)
+        self.axes.spines['bottom'].set_visible(False)
+        self.axes.spines['left'].set_visible(False)
+
+        self.axes.get_xaxis().set_ticks([])
+        self.axes.get_xaxis().set_ticks([], minor=True)
+        self.axes.get_yaxis().set_ticks([])
+
+        # # self.figure.tight_layout()
+        self.figure.subplots_adjust(
+            top=1,
+            bottom=0,
+            left=0,
+            right=1,
+            hspace=0,
+            wspace=0,
+        )
+
+        # the static axes are cached on every full draw,
+        # updates only restore them and draw the animated artists on top
+        self.background = None
+        self.artists = []
+        self.mpl_connect('draw_event', self.on_draw)
+
+    def animate(self, artist):
+        artist.set_animated(True)
+        self.artists.append(artist)
+        return artist
+
+    def on_draw(self, event):
+        self.background = self.copy_from_bbox(self.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        for artist in self.artists:
+            self.figure.draw_artist(artist)
+
+    def redraw(self):
+        if self.background is None:
+            self.draw_idle()
+            return
+        self.restore_region(self.background)
+        self.draw_artists()
+        self.blit(self.figure.bbox)
+
+    def relayout(self):
+        # the axes changed, the cached background is stale
+        self.background = None
+        self.draw_idle()
+
+
+class AudioCanvas(MPLCanvas):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.inited = False
+        self.line = None
+        self.axes.set_ylim(-32768, 32768)
+
+    def update_data(self, data: np.ndarray):
+        # data = data.copy() / data.max()
+        if not self.inited:
+            self.inited = True
+            self.line, = self.axes.plot(data, color=utils.PINK)
+            self.animate(self.line)
+            self.relayout()
+        elif len(self.line.get_ydata()) != len(data):
+            self.line.set_data(np.arange(len(data)), data)
+            self.axes.relim()
+            self.axes.autoscale_view(scaley=False)
+            self.relayout()
+        else:
+            self.line.set_ydata(data)
+            self.redraw()
+
+
+class SpectrumTicksCanvas(MPLCanvas):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.axes.set_xlim(20, 5000)
+        self.figure.subplots_adjust(
+            top=1,
+            bottom=0.999,
+            left=0,
+            right=1,
+            hspace=0,
+            wspace=0,
+        )
+        self.axes.set_xscale('log')
+        self.axes.get_xaxis().set_ticks([], minor=True)
+
+        ticks = [(27.5 * 2 ** i) for i in range(8)]
+        labels = [f'$A_{i}$' for i in range(8)]
+        self.axes.get_xaxis().set_ticks(ticks, labels)
+        logger.info("set ticks %s", ticks)
+        logger.info("set labels %s", labels)
+
+
+class SpectrumCanvas(MPLCanvas):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.spectrum_line = None
+        self.optimized_line = None
+        self.bar = None
+        self.inited = False
+
+        self.axes.set_ylim(-0.1, 1.1)
+        self.axes.set_xlim(20, 5000)
+        # self.figure.tight_layout()
+        self.figure.subplots_adjust(
+            top=1,
+            bottom=0,
+            left=0,
+            right=1,
+            hspace=0,
+            wspace=0,
+        )
+
+    def update_data(self, frequencies: np.ndarray, spectrum: np.ndarray, optimized: np.ndarray, frequency: float):
+        if frequency > 5000:
+            return
+
+        width = 0
+        if frequency > 50:
+            optimized.fill(0.0)
+            width = frequency / 50
+
+        if spectrum.max() > 0:
+            spectrum /= spectrum.max()
+        if optimized.max() > 0:
+            optimized /= optimized.max()
+
+        if not self.inited:
+            self.inited = True
+            self.spectrum_line, = self.axes.plot(frequencies, spectrum, color=utils.PINK, alpha=0.7)
+            self.optimized_line, = self.axes.plot(frequencies, optimized, color=utils.BLUE, alpha=0.5)
+            self.bar, = self.axes.bar(
+                frequency - width / 2, height=1, width=width, color=utils.GREEN)
+            self.axes.set_xscale('log')
+            for artist in (self.spectrum_line, self.optimized_line, self.bar):
+                self.animate(artist)
+            self.relayout()
+        elif len(self.spectrum_line.get_xdata()) != len(frequencies):
+            self.spectrum_line.set_data(frequencies, spectrum)
+            self.optimized_line.set_data(frequencies, optimized)
+            self.bar.set_x(frequency - width / 2)
+            self.bar.set_width(width)
+            self.relayout()
+        else:
+            self.spectrum_line.set_ydata(spectrum)
+            self.optimized_line.set_ydata(optimized)
+            self.bar.set_x(frequency - width / 2)
+            self.bar.set_width(width)
+            self.redraw()
+
+
+class CentBar(MPLCanvas):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.axes.set_xlim(-50.1, 50.1)
+        self.bar, = self.axes.barh([1, ], width=[0], color=utils.PINK)
+        self.animate(self.bar)
+
+    def update_data(self, data):
+        self.bar.set_width(data)
+        if data < -10:
+            self.bar.set_color(utils.PURPLE)
+        elif data > 10:
+            self.bar.set_color(utils.RED)
+        else:
+            self.bar.set_color(utils.GREEN)
+        self.redraw()
@@ -0,0 +1,86 @@
+# coding=utf-8
+
+import numpy as np
+
+
+def log_position(frequencies: np.ndarray, low: float, high: float) -> np.ndarray:
+    # 0 at low, 1 at high on a log axis
+    frequencies = np.maximum(frequencies, low * 1e-3)
+    return (np.log(frequencies) - np.log(low)) / (np.log(high) - np.log(low))
+
+
+class MinMaxEnvelope(object):
+
+    # Reduces a waveform to a min and a max per pixel column. The result is
+    # drawn as a polyline going min, max, min, max... one column after the
+    # other, which looks exactly like the full line at that width.
+    # The column boundaries only depend on (length, columns), they are
+    # rebuilt when either changes, which in practice means on resize.
+
+    def __init__(self) -> None:
+        self.key = None
+        self.starts = None
+        self.x = None
+
+    def table(self, count: int, columns: int):
+        if self.key == (count, columns):
+            return
+        self.key = (count, columns)
+        columns = max(1, min(columns, count))
+        self.starts = np.linspace(0, count, columns + 1).astype(int)[:-1]
+        # column centers, each twice, as a fraction of the data length
+        centers = (self.starts + np.diff(np.append(self.starts, count)) / 2) / count
+        self.x = np.repeat(centers, 2)
+
+    def __call__(self, data: np.ndarray, columns: int, out: np.ndarray = None) -> np.ndarray:
+        # out receives min, max interleaved, 2 * columns values
+        self.table(len(data), columns)
+        if out is None:
+            out = np.empty(len(self.x))
+        np.minimum.reduceat(data, self.starts, out=out[0::2])
+        np.maximum.reduceat(data, self.starts, out=out[1::2])
+        return out
+
+
+class LogSpectrumBins(object):
+
+    # Max pools spectrum bins into the pixel columns of a log frequency axis.
+    # Where bins are denser than pixels (high frequencies) every column keeps
+    # its loudest bin, where they are sparser (low frequencies) columns hold
+    # one bin each and empty columns are left out, so the line still goes
+    # through every bin. Bins outside [low, high] are never touched.
+
+    def __init__(self, low: float, high: float) -> None:
+        self.low = low
+        self.high = high
+        self.key = None
+        self.first = 0
+        self.last = 0
+        self.starts = None
+        self.x = None
+
+    def table(self, frequencies: np.ndarray, columns: int):
+        key = (id(frequencies), len(frequencies), frequencies[-1], columns)
+        if self.key == key:
+            return
+        self.key = key
+        position = log_position(frequencies, self.low, self.high)
+        inside = np.flatnonzero((position >= 0) & (position < 1))
+        if not len(inside):
+            self.first = self.last = 0
+            self.starts = np.zeros(0, dtype=int)
+            self.x = np.zeros(0)
+            return
+        self.first, self.last = inside[0], inside[-1] + 1
+        column = (position[self.first:self.last] * columns).astype(int)
+        # frequencies are increasing, so are the columns, a new group starts at every change
+        self.starts = np.flatnonzero(np.diff(column, prepend=-1))
+        self.x = (column[self.starts] + 0.5) / columns
+
+    def __call__(self, frequencies: np.ndarray, values: np.ndarray, columns: int, out: np.ndarray = None) -> np.ndarray:
+        self.table(frequencies, columns)
+        if out is None:
+            out = np.empty(len(self.x))
+        if len(self.x):
+            np.maximum.reduceat(values[self.first:self.last], self.starts, out=out)
+        return out
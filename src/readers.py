@@ -0,0 +1,81 @@
+# coding=utf-8
+
+import os
+import wave
+
+import numpy as np
+
+from recorder import Recording, SUFFIX
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+# Audio files read in blocks, for the batch tool and the file sources.
+# A reader is (sample rate, blocks(size)), blocks yields mono float blocks
+# between -1 and 1.
+
+
+def wave_reader(path: str):
+    # (sample rate, blocks(size)) where blocks yields mono float blocks of size
+    # samples, the last one shorter, only the stdlib, PCM 8, 16, 24 and 32 bit
+    file = wave.open(path, 'rb')
+    channels = file.getnchannels()
+    width = file.getsampwidth()
+
+    def blocks(size: int):
+        with file:
+            while True:
+                data = file.readframes(size)
+                if not data:
+                    break
+                if width == 1:
+                    samples = (np.frombuffer(data, np.uint8).astype(np.float32) - 128) / 128
+                elif width == 3:
+                    raw = np.frombuffer(data, np.uint8).reshape(-1, 3)
+                    samples = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) |
+                               (raw[:, 2].astype(np.int8).astype(np.int32) << 16)) / float(1 << 23)
+                else:
+                    dtype = {2: np.int16, 4: np.int32}[width]
+                    samples = np.frombuffer(data, dtype) / float(1 << (width * 8 - 1))
+                yield samples.reshape(-1, channels).mean(axis=1)
+
+    return file.getframerate(), blocks
+
+
+def sound_reader(path: str):
+    # FLAC, OGG and the rest of libsndfile, if soundfile is installed
+    if soundfile is None:
+        raise RuntimeError(f"reading {os.path.splitext(path)[1]} needs the soundfile package")
+
+    def blocks(size: int):
+        for block in soundfile.blocks(path, blocksize=size, dtype='float32', always_2d=True):
+            yield block.mean(axis=1)
+
+    return soundfile.info(path).samplerate, blocks
+
+
+def recording_reader(path: str):
+    # a capture recording, its chunks regrouped into blocks of size
+    recording = Recording(path)
+
+    def blocks(size: int):
+        pending = np.zeros(0, np.int16)
+        for samples, _, _, _ in recording.records():
+            pending = np.concatenate((pending, samples))
+            while len(pending) >= size:
+                yield pending[:size] / float(1 << 15)
+                pending = pending[size:]
+        if len(pending):
+            yield pending / float(1 << 15)
+
+    return recording.sample_rate, blocks
+
+
+def open_reader(path: str):
+    if path.lower().endswith('.wav'):
+        return wave_reader(path)
+    if path.endswith(SUFFIX):
+        return recording_reader(path)
+    return sound_reader(path)
@@ -0,0 +1,164 @@
+# coding=utf-8
+
+import os
+import mmap
+import time
+import struct
+import threading
+
+import numpy as np
+
+from logger import logger
+
+# A recording is a header and one record per captured chunk, everything
+# little endian and 8 byte aligned:
+#   header  magic, version, sample rate, block size, wall clock start
+#   record  samples, status, adc time, callback time, seconds since the
+#           start, then the int16 samples padded to 8 bytes
+# The sample count of a record is stored last, a count of 0 ends the
+# recording, so the zeros after the last record or a record cut short by a
+# crash read as the end.
+
+MAGIC = b'MUSICREC'
+VERSION = 1
+SUFFIX = '.musrec'
+HEADER = struct.Struct('<8sIII4xd')
+RECORD = struct.Struct('<IIddd')
+COUNT = struct.Struct('<I')
+FIELDS = struct.Struct('<Iddd')
+
+
+class Recorder(object):
+
+    # Appends the chunks of one capture to a recording. write() runs on the
+    # audio thread: two pack_into and a copy into the mapped file, no system
+    # call and no allocation beyond the small struct ones. The file is grown
+    # ahead of the writer by a thread of its own, SEGMENT at a time, and its
+    # pages touched there, so the writer never takes the page faults. A chunk
+    # that finds no room is dropped and counted, close() cuts the file to
+    # what was written.
+
+    SEGMENT = 32 << 20
+
+    def __init__(self, path: str, sample_rate: int, block_size: int) -> None:
+        self.path = path
+        self.file = open(path, 'w+b')
+        self.size = 0
+        # every map stays open until close(), the writer may hold an old one
+        self.maps = []
+        self.mapped = None
+        self.grow()
+        HEADER.pack_into(self.mapped[0], 0, MAGIC, VERSION, sample_rate, block_size, time.time())
+        self.position = HEADER.size
+        self.start = time.perf_counter()
+
+        self.chunks = 0
+        self.dropped = 0
+        self.wakeup = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='Recorder', daemon=True)
+        self.thread.start()
+        logger.info("recording to %s", path)
+
+    def grow(self):
+        size = self.size + self.SEGMENT
+        if os.name != 'nt':
+            self.file.truncate(size)
+        # windows can not change the size of a file with mapped views, a map
+        # longer than the file extends it instead
+        mapped = mmap.mmap(self.file.fileno(), size)
+        self.maps.append(mapped)
+        data = np.frombuffer(mapped, np.uint8)
+        data[self.size::mmap.PAGESIZE] = 0
+        # swapped in one go, the writer reads the three together
+        self.mapped = (mapped, data, size)
+        self.size = size
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            while self.running and self.position > self.size - self.SEGMENT // 2:
+                try:
+                    self.grow()
+                except (OSError, ValueError) as e:
+                    # the chunks that no longer fit are dropped and counted
+                    logger.error("recording to %s stops at %s bytes, can not grow it: %s", self.path, self.size, e)
+                    return
+
+    def write(self, chunk: np.ndarray, time_info: dict, status: int) -> bool:
+        count = len(chunk)
+        if not count:
+            return True
+        mapped, data, size = self.mapped
+        position = self.position
+        start = position + RECORD.size
+        end = start + ((count * 2 + 7) & ~7)
+        if end > size:
+            self.dropped += 1
+            self.wakeup.set()
+            return False
+
+        FIELDS.pack_into(
+            mapped, position + COUNT.size, status,
+            time_info.get('input_buffer_adc_time', 0.0), time_info.get('current_time', 0.0),
+            time.perf_counter() - self.start)
+        data[start:start + count * 2] = np.ascontiguousarray(chunk, np.int16).view(np.uint8)
+        COUNT.pack_into(mapped, position, count)
+        self.position = end
+        self.chunks += 1
+        if end > size - self.SEGMENT // 2:
+            self.wakeup.set()
+        return True
+
+    def close(self):
+        # only once write() can no longer be called
+        if self.file is None:
+            return
+        self.running = False
+        self.wakeup.set()
+        self.thread.join()
+        self.mapped = None
+        for mapped in self.maps:
+            mapped.flush()
+            mapped.close()
+        self.maps = []
+        self.file.truncate(self.position)
+        self.file.close()
+        self.file = None
+        logger.info("recorded %s chunks to %s, %s dropped", self.chunks, self.path, self.dropped)
+
+
+class Recording(object):
+
+    # A recording mapped read only, records() hands out views into the map,
+    # the samples are never copied. Works on a recording still being written.
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise ValueError(f"{path} is not a recording")
+        magic, version, self.sample_rate, self.block_size, self.started = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        if version != VERSION:
+            raise ValueError(f"{path} is a version {version} recording, this reads version {VERSION}")
+
+    def records(self):
+        # (samples, status, time_info, seconds since the start) per chunk
+        size = len(self.map)
+        position = HEADER.size
+        while position + RECORD.size <= size:
+            count, status, adc_time, current_time, received = RECORD.unpack_from(self.map, position)
+            start = position + RECORD.size
+            if not count or start + count * 2 > size:
+                break
+            time_info = {
+                'input_buffer_adc_time': adc_time,
+                'current_time': current_time,
+                'output_buffer_dac_time': 0.0,
+            }
+            yield np.frombuffer(self.map, np.int16, count, start), status, time_info, received
+            position = start + ((count * 2 + 7) & ~7)
@@ -0,0 +1,87 @@
+# coding=utf-8
+
+import time
+
+from utils import *
+from logger import logger
+
+
+class RenderScheduler(QtCore.QObject):
+
+    # Sits between the analysis results and the canvases. submit() only keeps
+    # the latest frame, a timer paints it at most FPS times a second, so when
+    # painting is slower than the analysis frames are dropped, never queued.
+
+    FPS = 30
+    SMOOTHING = 0.9
+
+    def __init__(self, paint, release=None, fps: int = FPS, parent=None) -> None:
+        super().__init__(parent)
+        # paint(frame) draws one frame, release(frame) hands it back to its owner
+        self.paint = paint
+        self.release = release
+        self.pending = None
+
+        self.received = 0
+        self.dropped = 0
+        self.painted = 0
+        self.paint_time = 0.0
+        self.max_paint_time = 0.0
+        # cost of the frame painted last, its update plus the paint events
+        # qt runs for it afterwards, recorded once the next tick comes
+        self.frame_time = None
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+        self.set_fps(fps)
+        self.timer.start()
+
+    def set_fps(self, fps: int):
+        self.fps = fps
+        self.timer.setInterval(int(1000 / fps))
+
+    def submit(self, frame):
+        self.received += 1
+        if self.pending is not None:
+            self.dropped += 1
+            self.discard(self.pending)
+        self.pending = frame
+
+    def tick(self):
+        if self.frame_time is not None:
+            self.record(self.frame_time)
+            self.frame_time = None
+        frame, self.pending = self.pending, None
+        if frame is None:
+            return
+        start = time.perf_counter()
+        try:
+            self.paint(frame)
+        except Exception as e:
+            logger.exception(e)
+        self.frame_time = time.perf_counter() - start
+        self.discard(frame)
+        self.painted += 1
+
+    def add_paint_time(self, duration: float):
+        # from the widgets' paint events, QPainter work happens there
+        if self.frame_time is not None:
+            self.frame_time += duration
+
+    def record(self, duration: float):
+        if self.paint_time:
+            self.paint_time = self.paint_time * self.SMOOTHING + duration * (1 - self.SMOOTHING)
+        else:
+            self.paint_time = duration
+        self.max_paint_time = max(self.max_paint_time, duration)
+
+    def discard(self, frame):
+        if self.release is not None:
+            self.release(frame)
+
+    def stop(self):
+        self.timer.stop()
+        if self.pending is not None:
+            self.discard(self.pending)
+            self.pending = None
@@ -0,0 +1,162 @@
+# coding=utf-8
+
+import collections
+
+import numpy as np
+
+
+class RingBuffer(object):
+
+    # every sample is written twice, at index and index + size,
+    # so the latest window is always one contiguous slice of data
+    # and reading it never needs a concatenate or a roll
+
+    def __init__(self, size: int, dtype=np.float64) -> None:
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        self.data = np.zeros(size * 2, dtype=self.dtype)
+        self.index = 0
+        self.written = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.data.fill(0)
+        self.index = 0
+        self.written = 0
+
+    def append(self, chunk: np.ndarray):
+        total = count = len(chunk)
+        if count >= self.size:
+            chunk = chunk[-self.size:]
+            count = self.size
+
+        size = self.size
+        start = self.index
+        end = start + count
+        if end <= size:
+            self.data[start:end] = chunk
+            self.data[start + size:end + size] = chunk
+        else:
+            split = size - start
+            self.data[start:size] = chunk[:split]
+            self.data[start + size:] = chunk[:split]
+            self.data[:count - split] = chunk[split:]
+            self.data[size:size + count - split] = chunk[split:]
+
+        self.index = end % size
+        # after the copy, readers take written as the end of what is there,
+        # every sample counts, also the ones a long chunk pushes out at once
+        self.written += total
+
+    def view(self) -> np.ndarray:
+        # oldest to newest, only valid until the next append
+        view = self.data[self.index:self.index + self.size]
+        view.flags.writeable = False
+        return view
+
+    def read(self, out: np.ndarray, window: np.ndarray = None) -> np.ndarray:
+        if window is None:
+            np.copyto(out, self.view(), casting='unsafe')
+        else:
+            np.multiply(self.view(), window, out=out)
+        return out
+
+
+class ConsumerBuffer(object):
+
+    # One reader of a capture with a ring of its own and its own read
+    # position. The audio thread writes, the reader reads, neither ever waits
+    # for the other. When the reader falls a ring behind the policy decides
+    # who loses samples: OLDEST overwrites the oldest unread ones, NEWEST
+    # drops the incoming chunks until the reader catches up. Either way only
+    # this consumer loses them, the capture and the other consumers go on.
+
+    CAPACITY = 1 << 16
+    OLDEST = 'oldest'
+    NEWEST = 'newest'
+    POLICIES = (OLDEST, NEWEST)
+
+    def __init__(self, name: str, capacity: int = CAPACITY, policy: str = OLDEST,
+                 notify=None, dtype=np.int16) -> None:
+        if policy not in self.POLICIES:
+            raise ValueError(f"unknown drop policy {policy}, choose from {self.POLICIES}")
+        self.name = name
+        self.policy = policy
+        # called on the audio thread after every write, has to stay cheap
+        self.notify = notify
+        self.ring = RingBuffer(capacity, dtype)
+        self.scratch = np.zeros(capacity, dtype=self.ring.dtype)
+
+        # written by the audio thread only
+        self.reserved = 0
+        self.last = 0
+        self.rejected = 0
+        # written by the reader only
+        self.position = 0
+        self.overwritten = 0
+
+    @property
+    def dropped(self):
+        return self.rejected + self.overwritten
+
+    def pending(self):
+        # how far behind the reader is, in samples
+        return self.ring.written - self.position
+
+    def write(self, chunk: np.ndarray):
+        if self.policy == self.NEWEST and self.pending() + len(chunk) > len(self.ring):
+            self.rejected += len(chunk)
+            return
+        # announced before the copy, so a read running meanwhile knows
+        # which samples may be torn
+        self.reserved = self.ring.written + len(chunk)
+        self.ring.append(chunk)
+        self.last = len(chunk)
+        if self.notify is not None:
+            self.notify()
+
+    def read(self) -> np.ndarray:
+        # everything not read yet, oldest first, in a buffer of the consumer's
+        # own that stays valid until the next read
+        size = len(self.ring)
+        written = self.ring.written
+        start = max(self.position, written - size)
+        count = written - start
+        offset = start % size
+        np.copyto(self.scratch[:count], self.ring.data[offset:offset + count])
+        # samples the writer went over while they were being copied
+        torn = min(count, max(0, self.reserved - size - start))
+        self.overwritten += start - self.position + torn
+        self.position = written
+        return self.scratch[torn:count]
+
+    def clear(self):
+        self.position = self.ring.written
+
+
+class SnapshotPool(object):
+
+    # Hands out preallocated arrays to the producer (analysis worker).
+    # A snapshot belongs to the consumer (GUI) from the moment it is published
+    # until the consumer calls release(), the producer never writes to it
+    # in between. When every snapshot is taken the producer gets None and
+    # has to drop the frame instead of overwriting one that is being drawn.
+
+    def __init__(self, factory, count: int = 3) -> None:
+        self.factory = factory
+        self.count = count
+        self.items = [factory() for _ in range(count)]
+        self.free = collections.deque(self.items)
+
+    def acquire(self):
+        try:
+            return self.free.popleft()
+        except IndexError:
+            return None
+
+    def release(self, snapshot):
+        # snapshots of a replaced pool are simply dropped
+        if any(snapshot is item for item in self.items):
+            self.free.append(snapshot)
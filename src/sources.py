@@ -0,0 +1,327 @@
+# coding=utf-8
+
+import os
+import time
+import threading
+
+import numpy as np
+
+from logger import logger
+from readers import open_reader
+from recorder import Recording
+
+try:
+    import pyaudiowpatch as pyaudio
+except ImportError:
+    try:
+        import pyaudio
+    except ImportError:
+        pyaudio = None
+
+
+# status bits handed to the callback, the PortAudio values
+INPUT_OVERFLOW = 2
+FULL_SCALE = 32767
+
+
+class AudioSource(object):
+
+    # Produces mono int16 chunks and hands them to callback(chunk, time_info,
+    # status) on a thread of its own, from start() until stop(). The chunk is
+    # only valid during the call. time_info has the PortAudio keys,
+    # status has INPUT_OVERFLOW set when samples were lost before the chunk.
+
+    def __init__(self, name: str, sample_rate: int, block_size: int) -> None:
+        self.name = name
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.callback = None
+        # backlog() is how many samples the slowest consumer has still to
+        # read, set by whoever runs the source, only unpaced sources use it
+        self.backlog = None
+
+    def start(self, callback):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+
+class PortAudioSource(AudioSource):
+
+    # an input device in callback mode, PortAudio's thread calls back
+
+    def __init__(self, audio, info: dict, block_size: int) -> None:
+        super().__init__(info.get('name'), int(info.get('defaultSampleRate')), block_size)
+        self.audio = audio
+        self.info = info
+        self.stream = None
+
+    def start(self, callback):
+        self.callback = callback
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.sample_rate,
+            input=True,
+            frames_per_buffer=self.block_size,
+            stream_callback=self.stream_callback,
+            input_device_index=self.info.get('index'),
+        )
+        self.stream.start_stream()
+
+    def stop(self):
+        if self.stream is None:
+            return
+        self.stream.stop_stream()
+        self.stream.close()
+        self.stream = None
+
+    def stream_callback(self, data, frame_count, time_info, status):
+        # data is an immutable bytes object, the view is safe during the call
+        self.callback(np.frombuffer(data, np.int16), time_info, status)
+        return (data, pyaudio.paContinue)
+
+
+class ThreadedSource(AudioSource):
+
+    # A source that makes its chunks in a loop on its own thread, read()
+    # returns (chunk, status), (None, status) for a block that was lost,
+    # or None at the end. The loop is paced to speed times real time,
+    # 0 delivers in lockstep with the consumers: a chunk only goes out once
+    # every consumer has read the ones before, so nothing is dropped and
+    # every run hands them the same chunks in the same reads.
+
+    # seconds between two looks at the backlog
+    POLL = 0.0005
+
+    def __init__(self, name: str, sample_rate: int, block_size: int, speed: float = 1.0) -> None:
+        super().__init__(name, sample_rate, block_size)
+        self.speed = speed
+        self.thread = None
+        self.running = False
+
+    def read(self):
+        raise NotImplementedError
+
+    def due(self, produced: int) -> float:
+        # seconds from the start until the chunk ending at sample produced
+        # is delivered, its last sample is due then
+        return produced / self.sample_rate / self.speed
+
+    def time_info(self, stream_time: float, begin: float) -> dict:
+        return {
+            'input_buffer_adc_time': stream_time,
+            'current_time': time.perf_counter() - begin,
+            'output_buffer_dac_time': 0.0,
+        }
+
+    def start(self, callback):
+        self.callback = callback
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def wait(self):
+        # at speed 0, until the consumers are through with the last chunk
+        while self.running and self.backlog is not None and self.backlog() > 0:
+            time.sleep(self.POLL)
+
+    def run(self):
+        begin = time.perf_counter()
+        produced = 0
+        while self.running:
+            block = self.read()
+            if block is None:
+                logger.info("%s ended", self.name)
+                break
+            chunk, status = block
+            stream_time = produced / self.sample_rate
+            produced += self.block_size if chunk is None else len(chunk)
+            if self.speed:
+                wait = begin + self.due(produced) - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            else:
+                self.wait()
+            if chunk is None or not self.running:
+                continue
+            self.callback(chunk, self.time_info(stream_time, begin), status)
+        self.running = False
+
+
+class BlockingSource(ThreadedSource):
+
+    # an input device read in blocking mode on a thread of ours, the device
+    # paces the reads, for hosts where callback streams misbehave
+
+    def __init__(self, audio, info: dict, block_size: int) -> None:
+        super().__init__(info.get('name'), int(info.get('defaultSampleRate')), block_size, speed=0)
+        self.audio = audio
+        self.info = info
+        self.stream = None
+
+    def start(self, callback):
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.sample_rate,
+            input=True,
+            frames_per_buffer=self.block_size,
+            input_device_index=self.info.get('index'),
+        )
+        super().start(callback)
+
+    def stop(self):
+        # the thread leaves after at most one block
+        super().stop()
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+    def wait(self):
+        # the device paces the reads, a slow consumer drops samples instead
+        pass
+
+    def read(self):
+        # PyAudio hides overflows here unless it throws the block away
+        data = self.stream.read(self.block_size, exception_on_overflow=False)
+        return np.frombuffer(data, np.int16), 0
+
+
+class FileSource(ThreadedSource):
+
+    # plays an audio file as if it came from a device, in real time, faster,
+    # or as fast as possible with speed 0, optionally over and over,
+    # recordings are played by ReplaySource instead
+
+    def __init__(self, path: str, block_size: int, speed: float = 1.0, loop: bool = False) -> None:
+        # the readers of the batch tool, wav or whatever soundfile reads
+        sample_rate, self.blocks = open_reader(path)
+        super().__init__(os.path.basename(path), sample_rate, block_size, speed)
+        self.path = path
+        self.loop = loop
+        self.iterator = None
+
+    def start(self, callback):
+        # from the top, in blocks of the current size
+        self.iterator = None
+        super().start(callback)
+
+    def read(self):
+        # at most the rest of this pass and one more, a whole pass without a
+        # block is an empty file, that ends even when looping
+        for _ in range(2):
+            if self.iterator is None:
+                if self.blocks is None:
+                    _, self.blocks = open_reader(self.path)
+                self.iterator, self.blocks = self.blocks(self.block_size), None
+            block = next(self.iterator, None)
+            if block is not None:
+                return (np.clip(block, -1, 1) * FULL_SCALE).astype(np.int16), 0
+            self.iterator = None
+            if not self.loop:
+                return None
+        logger.warning("%s has no samples", self.name)
+        return None
+
+
+class SyntheticSource(ThreadedSource):
+
+    # A tone with harmonics and noise, delivered with jitter and dropouts like
+    # an unreliable device. jitter is how late a chunk may come, in blocks,
+    # dropout the probability a chunk is lost, the next one then has
+    # INPUT_OVERFLOW set. seconds None runs until stopped.
+
+    def __init__(self, sample_rate: int = 44100, block_size: int = 1024, frequency: float = 440.0,
+                 harmonics: int = 3, amplitude: float = 0.5, noise: float = 0.0,
+                 jitter: float = 0.0, dropout: float = 0.0, speed: float = 1.0,
+                 seconds: float = None, seed: int = None) -> None:
+        super().__init__(f'synthetic {frequency:g} Hz', sample_rate, block_size, speed)
+        self.frequency = frequency
+        self.harmonics = np.arange(1, harmonics + 1)
+        # harmonics above nyquist left out, falling off as 1 / h
+        self.gains = np.where(self.harmonics * frequency < sample_rate / 2, 1.0 / self.harmonics, 0.0)
+        self.amplitude = amplitude / self.gains.sum()
+        self.noise = noise
+        self.jitter = jitter
+        self.dropout = dropout
+        self.remaining = None if seconds is None else int(seconds * sample_rate)
+        self.rng = np.random.default_rng(seed)
+        self.position = 0
+        self.lost = False
+
+    def due(self, produced: int) -> float:
+        # late chunks do not delay the ones after them
+        lateness = self.rng.uniform(0, self.jitter) * self.block_size / self.sample_rate if self.jitter else 0.0
+        return super().due(produced) + lateness
+
+    def read(self):
+        if self.remaining is not None:
+            if self.remaining <= 0:
+                return None
+            self.remaining -= self.block_size
+
+        t = (self.position + np.arange(self.block_size)) / self.sample_rate
+        self.position += self.block_size
+        if self.dropout and self.rng.random() < self.dropout:
+            # the time passes, the chunk never arrives
+            self.lost = True
+            return None, 0
+
+        signal = np.sin(2 * np.pi * self.frequency * np.outer(t, self.harmonics)) @ self.gains * self.amplitude
+        if self.noise:
+            signal += self.rng.normal(0, self.noise, self.block_size)
+        status = INPUT_OVERFLOW if self.lost else 0
+        self.lost = False
+        return (np.clip(signal, -1, 1) * FULL_SCALE).astype(np.int16), status
+
+
+class ReplaySource(ThreadedSource):
+
+    # Plays a recording back chunk for chunk with the recorded status and
+    # time_info, the samples straight out of the mapped file. At speed 1 every
+    # chunk comes when it came while recording, jitter included.
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False) -> None:
+        self.recording = Recording(path)
+        super().__init__(os.path.basename(path), self.recording.sample_rate, self.recording.block_size, speed)
+        self.loop = loop
+        self.records = None
+        self.record = None
+        # recorded time of the passes already played, when looping
+        self.offset = 0.0
+
+    def start(self, callback):
+        self.records = None
+        self.offset = 0.0
+        super().start(callback)
+
+    def read(self):
+        if self.records is None:
+            self.records = self.recording.records()
+        record = next(self.records, None)
+        if record is None:
+            self.records = None
+            if not self.loop or self.record is None:
+                return None
+            samples, _, _, received = self.record
+            self.offset += received + len(samples) / self.sample_rate
+            self.record = None
+            return self.read()
+        self.record = record
+        samples, status, _, _ = record
+        return samples, status
+
+    def due(self, produced: int) -> float:
+        return (self.offset + self.record[3]) / self.speed
+
+    def time_info(self, stream_time: float, begin: float) -> dict:
+        return self.record[2]
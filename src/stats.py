@@ -0,0 +1,145 @@
+# coding=utf-8
+
+import json
+import time
+import threading
+
+import numpy as np
+
+
+class RollingHistogram(object):
+
+    # The last SIZE durations of one stage in a preallocated ring, recording
+    # is one store and one add, percentiles and the histogram are only worked
+    # out when somebody looks at them.
+
+    SIZE = 1024
+    # log spaced bins from 1 us to 1 s
+    EDGES = np.logspace(-6, 0, 25)
+
+    def __init__(self, size: int = SIZE) -> None:
+        self.values = np.zeros(size)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+        self.total += value
+
+    def recent(self) -> np.ndarray:
+        return self.values[:min(self.count, len(self.values))]
+
+    def summary(self) -> dict:
+        values = self.recent()
+        if not len(values):
+            return {'count': 0}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        counts, _ = np.histogram(values, self.EDGES)
+        return {
+            'count': self.count,
+            'mean': float(values.mean()),
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+            'max': float(values.max()),
+            # lifetime average, the rest only covers the recent values
+            'average': self.total / self.count,
+            'histogram': counts.tolist(),
+        }
+
+
+class Timer(object):
+
+    # with stats.time('stage'): ...
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: RollingHistogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.add(time.perf_counter() - self.start)
+
+
+class NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Stats(object):
+
+    # Named stage timings and event counters for the hot path. Every stage is
+    # written by one thread only (callback, worker or gui), so recording takes
+    # no lock, a stage is created the first time it is seen.
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name: str) -> RollingHistogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, RollingHistogram())
+        return histogram
+
+    def time(self, name: str):
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self.histogram(name))
+
+    def record(self, name: str, seconds: float):
+        if self.enabled:
+            self.histogram(name).add(seconds)
+
+    def count(self, name: str, value: int = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        return {
+            'time': time.time(),
+            'edges': RollingHistogram.EDGES.tolist(),
+            'stages': {name: histogram.summary() for name, histogram in list(self.histograms.items())},
+            'counters': dict(self.counters),
+        }
+
+    def dump(self, path: str):
+        with open(path, 'w') as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+    def report(self) -> str:
+        # one line per stage, milliseconds
+        lines = [f'{"stage":<20}{"count":>8}{"p50":>8}{"p95":>8}{"max":>8}']
+        for name, histogram in sorted(list(self.histograms.items())):
+            summary = histogram.summary()
+            if not summary['count']:
+                continue
+            lines.append(
+                f'{name:<20}{summary["count"]:>8}{summary["p50"] * 1000:>8.2f}'
+                f'{summary["p95"] * 1000:>8.2f}{summary["max"] * 1000:>8.2f}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'{name:<20}{value:>8}')
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+
+
+stats = Stats()
@@ -1,162 +1,74 @@
-import pyaudiowpatch as pyaudio
+import time
+import argparse
 
-import utils
 from utils import *
 from logger import logger
+from capture import hub
+from worker import AnalysisWorker
+from ringbuffer import SnapshotPool
+from analysis import AnalysisFrame
+from detectors import DETECTORS
+from engine import PitchEngine, PitchResult
+from render import RenderScheduler
+from stats import stats
+from canvas import PainterCanvas, SpectrogramCanvas
 import ui.tuner
 
 
-class MPLCanvas(FigureCanvasQTAgg):
-
-    def __init__(self) -> None:
-        self.figure = Figure()
-        super().__init__(self.figure)
-        self.axes = self.figure.add_subplot(1, 1, 1)
-        self.axes.margins(0.01)
-        self.axes.set_facecolor((0.8, 0.8, 0.8))
-
-        self.axes.spines['top'].set_visible(False)
-        self.axes.spines['right'].set_visible(False)
-        self.axes.spines['bottom'].set_visible(False)
-        self.axes.spines['left'].set_visible(False)
-
-        self.axes.get_xaxis().set_ticks([])
-        self.axes.get_xaxis().set_ticks([], minor=True)
-        self.axes.get_yaxis().set_ticks([])
-
-        # # self.figure.tight_layout()
-        self.figure.subplots_adjust(
-            top=1,
-            bottom=0,
-            left=0,
-            right=1,
-            hspace=0,
-            wspace=0,
-        )
-
-
-class AudioCanvas(MPLCanvas):
-
-    def __init__(self) -> None:
-        super().__init__()
-        self.inited = False
-        self.line = None
-        self.axes.set_ylim(-32768, 32768)
-
-    def update_data(self, data: np.ndarray):
-        # data = data.copy() / data.max()
-        if not self.inited:
-            self.inited = True
-            self.line, = self.axes.plot(data, color=utils.PINK)
-        else:
-            self.line.set_ydata(data)
-        self.draw()
-
-
-class SpectrumTicksCanvas(MPLCanvas):
-
-    def __init__(self) -> None:
-        super().__init__()
-        self.axes.set_xlim(20, 5000)
-        self.figure.subplots_adjust(
-            top=1,
-            bottom=0.999,
-            left=0,
-            right=1,
-            hspace=0,
-            wspace=0,
-        )
-        self.axes.set_xscale('log')
-        self.axes.get_xaxis().set_ticks([], minor=True)
-
-        ticks = [(27.5 * 2 ** i) for i in range(8)]
-        labels = [f'$A_{i}$' for i in range(8)]
-        self.axes.get_xaxis().set_ticks(ticks, labels)
-        logger.info("set ticks %s", ticks)
-        logger.info("set labels %s", labels)
-
-
-class SpectrumCanvas(MPLCanvas):
-
-    def __init__(self) -> None:
-        super().__init__()
-        self.spectrum_line = None
-        self.optimized_line = None
-        self.bar = None
-        self.inited = False
-
-        self.axes.set_ylim(-0.1, 1.1)
-        self.axes.set_xlim(20, 5000)
-        # self.figure.tight_layout()
-        self.figure.subplots_adjust(
-            top=1,
-            bottom=0,
-            left=0,
-            right=1,
-            hspace=0,
-            wspace=0,
-        )
-
-    def update_data(self, frequencies: np.ndarray, spectrum: np.ndarray, optimized: np.ndarray, frequency: float):
-        if frequency > 5000:
-            return
-
-        width = 0
-        if frequency > 50:
-            optimized.fill(0.0)
-            width = frequency / 50
-
-        if spectrum.max() > 0:
-            spectrum /= spectrum.max()
-        if optimized.max() > 0:
-            optimized /= optimized.max()
-
-        if not self.inited:
-            self.inited = True
-            self.spectrum_line, = self.axes.plot(frequencies, spectrum, color=utils.PINK, alpha=0.7)
-            self.optimized_line, = self.axes.plot(frequencies, optimized, color=utils.BLUE, alpha=0.5)
-            self.bar, = self.axes.bar(
-                frequency - width / 2, height=1, width=width, color=utils.GREEN)
-            self.axes.set_xscale('log')
-        else:
-            self.spectrum_line.set_ydata(spectrum)
-            self.optimized_line.set_ydata(optimized)
-            self.bar.set_x(frequency - width / 2)
-            self.bar.set_width(width)
-
-        self.draw()
-
-
-class CentBar(MPLCanvas):
-
-    def __init__(self) -> None:
-        super().__init__()
-        self.axes.set_xlim(-50.1, 50.1)
-        self.bar, = self.axes.barh([1, ], width=[0], color=utils.PINK)
-
-    def update_data(self, data):
-        self.bar.set_width(data)
-        if data < -10:
-            self.bar.set_color(utils.PURPLE)
-        elif data > 10:
-            self.bar.set_color(utils.RED)
-        else:
-            self.bar.set_color(utils.GREEN)
-        self.draw()
+def load_canvases(backend: str):
+    # matplotlib is only imported when it is asked for
+    if backend == 'matplotlib':
+        import mplcanvas
+        return mplcanvas
+    import canvas
+    return canvas
 
 
 class Signal(QtCore.QObject):
 
-    frame = QtCore.Signal(object, object, object, float)
+    frame = QtCore.Signal(object)
+    # futures of the capture hub, done on its thread
+    devices = QtCore.Signal(object)
+    opened = QtCore.Signal(object, object)
 
 
 class Tuner(QtWidgets.QWidget):
 
+    # device block size (PortAudio frames_per_buffer)
     CHUNK_SIZE = 2048
+    BLOCK_SIZES = [256, 512, 1024, 2048, 4096]
+    # analyses per second, independent of the block size
+    ANALYSIS_RATE = 20
+    ANALYSIS_RATES = [5, 10, 20, 30, 50]
     BUFFER_SIZE = CHUNK_SIZE * 10
+    WINDOW_SIZES = [CHUNK_SIZE * 1, CHUNK_SIZE * 2, CHUNK_SIZE * 4, CHUNK_SIZE * 8, BUFFER_SIZE]
     HPS_HARMONICS = 3
-    A0 = 27.5
-    NOTENAMES = 'A A# B C C# D D# E F F# G G#'.split(" ")
+    REFINEMENT = 'phase'
+    DETECTOR = 'hps'
+    DETECTOR_OPTIONS = {'hps': {'refinement': REFINEMENT}}
+    # skip analysis and redraws on silence and steady notes
+    GATE = True
+    # paints per second at most, results in between are dropped
+    FPS = 30
+    # 'qt' paints with QPainter, 'matplotlib' uses the Agg canvases
+    BACKEND = 'qt'
+    # analyse at sample_rate / DECIMATION, at most 4 at 44.1 kHz so 5000 Hz
+    # stays below nyquist, the top notes are then scored on the harmonics
+    # left, yin and mpm always analyse at the device rate
+    DECIMATION = 1
+    # open the device highlighted in the list before it is picked,
+    # the switch then has no gap, but the device is held open meanwhile
+    PREOPEN = False
+    # host api picked at start, None for the first one
+    HOST_API = None
+    # 'single' runs the analysis in float32
+    PRECISION = 'double'
+    # history shown by the spectrogram
+    SPECTROGRAM_SECONDS = 10
+    # F3 shows the stage timings, F4 writes them to STATS_FILE,
+    # F5 lists the input devices again
+    STATS_FILE = 'tuner-stats.json'
+    STATS_INTERVAL = 500
 
     def __init__(self, parent=None) -> None:
         super().__init__(parent)
@@ -167,67 +79,201 @@ class Tuner(QtWidgets.QWidget):
         self.form = ui.tuner.Ui_Tuner()
         self.form.setupUi(self)
 
-        self.audio_canvas = AudioCanvas()
+        canvases = load_canvases(self.BACKEND)
+
+        self.audio_canvas = canvases.AudioCanvas()
         self.form.buffer_layout.addWidget(self.audio_canvas)
 
-        self.spectrum_canvas = SpectrumCanvas()
+        self.spectrum_canvas = canvases.SpectrumCanvas()
         self.form.spectrum_layout.addWidget(self.spectrum_canvas)
 
-        self.form.spectrum_tick_layout.addWidget(SpectrumTicksCanvas())
+        self.spectrogram = SpectrogramCanvas()
+        self.form.spectrum_layout.addWidget(self.spectrogram)
 
-        self.centbar = CentBar()
+        self.form.spectrum_tick_layout.addWidget(canvases.SpectrumTicksCanvas())
+
+        self.centbar = canvases.CentBar()
         self.form.centbar_layout.addWidget(self.centbar)
 
+        self.scheduler = RenderScheduler(self.draw_frame, lambda frame: self.snapshots.release(frame), self.FPS, self)
+        # the QPainter work of a frame happens in the paint events after it
+        for canvas in (self.audio_canvas, self.spectrum_canvas, self.spectrogram, self.centbar):
+            if isinstance(canvas, PainterCanvas):
+                canvas.listener = self.scheduler.add_paint_time
         self.signal = Signal(self)
-        self.signal.frame.connect(self.draw_frame)
+        self.signal.frame.connect(self.receive_frame)
+
+        self.overlay = QtWidgets.QLabel(self)
+        self.overlay.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.overlay.setStyleSheet('background: rgba(255, 255, 255, 200); padding: 4px;')
+        self.overlay.hide()
+        self.overlay_timer = QtCore.QTimer(self)
+        self.overlay_timer.setInterval(self.STATS_INTERVAL)
+        self.overlay_timer.timeout.connect(self.update_overlay)
 
         self.form.input_devices_box.currentIndexChanged.connect(self.input_device_changed)
+        self.form.input_devices_box.highlighted.connect(self.input_device_highlighted)
         self.form.input_api_box.currentIndexChanged.connect(self.input_api_changed)
+        self.signal.devices.connect(self.devices_listed)
+        self.signal.opened.connect(self.stream_opened)
 
         # init audio
-        self.sample_rate = 44100
-        self.buffer = np.zeros(self.BUFFER_SIZE)
-        self.hanning = np.hanning(len(self.buffer))
-
-        self.audio = pyaudio.PyAudio()
-        for i in range(0, self.audio.get_host_api_count()):
-            api = self.audio.get_host_api_info_by_index(i)
-            self.form.input_api_box.addItem(api.get("name"), userData=api)
-            logger.info(api)
-
-        self.form.input_api_box.setCurrentIndex(0)
-        self.form.input_devices_box.setCurrentIndex(0)
+        self.block_size = self.CHUNK_SIZE
+        self.engine = PitchEngine(
+            44100, self.BUFFER_SIZE, self.DETECTOR, self.ANALYSIS_RATE,
+            self.DECIMATION, self.HPS_HARMONICS, self.GATE, spectrum=True, precision=self.PRECISION)
+        self.engine.options = self.DETECTOR_OPTIONS
+        self.spectrogram.set_rows(*self.spectrogram_rows())
+        self.snapshots = None
+        self.worker = AnalysisWorker(self.engine.feed, self.analyse_frame, self.signal.frame.emit)
+        self.configure()
+
+        self.window_box = self.add_option_box(
+            [(f'{size} samples', size) for size in self.WINDOW_SIZES],
+            self.engine.window_size, self.set_window_size)
+        self.detector_box = self.add_option_box(
+            [(name.upper(), name) for name in DETECTORS],
+            self.engine.detector_name, self.set_detector)
+        self.analyses_box = self.add_option_box(
+            [(f'{rate} / s', rate) for rate in self.ANALYSIS_RATES],
+            self.engine.analyses, self.set_analysis_rate)
+        self.block_box = self.add_option_box(
+            [(f'{size} block', size) for size in self.BLOCK_SIZES],
+            self.block_size, self.set_block_size)
+        self.precision_box = self.add_option_box(
+            [('float64', 'double'), ('float32', 'single')],
+            self.engine.precision, self.set_precision)
+
+        self.worker.start()
+
+        # the device is shared with every other view reading it, the hub
+        # lists and opens devices on its own thread
+        self.hub = hub
+        self.capture = None
+        # (info, index) of the device picked last, whatever opens before is stale
+        self.device = None
+        self.list_devices()
+
+    def spectrogram_rows(self):
+        # (rows, rows a second), a row per painted frame at most
+        rate = min(self.FPS, self.engine.analyses)
+        return self.SPECTROGRAM_SECONDS * rate, rate
+
+    def configure(self):
+        # rebuilds the analysis state for the current settings,
+        # once the worker is running this only ever runs on the worker thread
+        engine = self.engine
+        engine.configure()
+        if self.snapshots is None or len(self.snapshots.items[0].buffer) != engine.window_size:
+            self.snapshots = SnapshotPool(lambda: AnalysisFrame(engine.window_size))
+
+        # the worker counts device samples
+        self.worker.hop = engine.hop
+        self.worker.boundary = 0
+
+    def add_option_box(self, items, current, setter):
+        box = QtWidgets.QComboBox(self)
+        for text, data in items:
+            box.addItem(text, userData=data)
+        box.setCurrentIndex([data for _, data in items].index(current))
+        box.currentIndexChanged.connect(lambda index: setter(box.itemData(index)))
+        self.form.horizontalLayout_9.addWidget(box)
+        return box
+
+    def set_window_size(self, size: int):
+        logger.info("window size %s", size)
+        self.engine.window_size = size
+        self.worker.invoke(self.configure)
+
+    def set_detector(self, name: str):
+        logger.info("pitch detector %s", name)
+        self.engine.detector_name = name
+        self.worker.invoke(self.configure)
+
+    def set_analysis_rate(self, rate: int):
+        logger.info("analysis rate %s", rate)
+        self.engine.analyses = rate
+        self.spectrogram.set_rows(*self.spectrogram_rows())
+        self.worker.invoke(self.configure)
+
+    def set_precision(self, precision: str):
+        logger.info("precision %s", precision)
+        self.engine.precision = precision
+        self.worker.invoke(self.configure)
+
+    def set_block_size(self, size: int):
+        logger.info("block size %s", size)
+        self.block_size = size
+        if self.device is not None:
+            api = self.form.input_api_box.currentIndex()
+            self.restart_stream(api, self.form.input_devices_box.currentIndex())
+
+    def list_devices(self, refresh: bool = False):
+        self.hub.submit(self.hub.devices, refresh).add_done_callback(self.signal.devices.emit)
+
+    def devices_listed(self, future):
+        try:
+            inputs = future.result()
+        except Exception as e:
+            logger.error("listing devices failed: %s", e)
+            return
+        box = self.form.input_api_box
+        current = box.currentText()
+        box.blockSignals(True)
+        box.clear()
+        for api, devices in inputs:
+            box.addItem(api.get("name"), userData=devices)
+            logger.info("host api %s", api.get('name'))
+            logger.debug("%s", api)
+        # the same host api again after a refresh
+        box.setCurrentIndex(max(0, box.findText(current or self.HOST_API or '')))
+        box.blockSignals(False)
+        if box.count():
+            self.input_api_changed(box.currentIndex())
+
+    def release_stream(self):
+        # the old device closes on the hub thread, unless somebody else reads it
+        self.device = None
+        self.capture = None
+        self.hub.submit(self.hub.release, self.worker.input)
 
     def restart_stream(self, api, index):
-        if hasattr(self, 'stream'):
-            self.stream.stop_stream()
         info = self.form.input_devices_box.itemData(index)
-        self.sample_rate = int(info.get("defaultSampleRate"))
-        self.frequencies = np.fft.fftfreq(len(self.buffer), 1. / self.sample_rate)
-        self.frequencies = self.frequencies[:len(self.buffer) // 2]
-        logger.info("start stream %s", info)
+        if info is None:
+            return
+        self.release_stream()
+        self.worker.clear()
+        self.engine.sample_rate = int(info.get("defaultSampleRate"))
+        self.worker.invoke(self.configure)
+        self.worker.invoke(self.engine.restart)
+        logger.info("start stream %s", info.get('name'))
+        device = self.device = (info, index)
+        future = self.hub.submit(self.hub.open, info, self.block_size, self.worker.input)
+        future.add_done_callback(lambda future: self.signal.opened.emit(device, future))
+
+    def stream_opened(self, device, future):
+        if device is not self.device:
+            # switched again meanwhile, the hub has released it already
+            return
+        info, index = device
         try:
-            self.stream = self.audio.open(
-                format=pyaudio.paInt16,
-                channels=1,
-                rate=self.sample_rate,
-                input=True,
-                # output=True,
-                frames_per_buffer=self.CHUNK_SIZE,
-                stream_callback=self.stream_callback,
-                input_device_index=info.get('index'),
-            )
+            self.capture = future.result()
         except OSError as e:
             logger.error(e)
             self.form.input_devices_box.setItemText(index, f"[INVALID] {info.get('name')}")
-            return
-        self.stream.start_stream()
+
+    def input_device_highlighted(self, index):
+        info = self.form.input_devices_box.itemData(index)
+        if self.PREOPEN and info is not None and (self.device is None or info.get('index') != self.device[0].get('index')):
+            self.hub.submit(self.hub.preopen, info, self.block_size)
 
     def closeEvent(self, event: QCloseEvent) -> None:
         logger.info("Tuner closing...")
 
-        self.stream.stop_stream()
-        self.audio.terminate()
+        # the device stays open as long as another view reads it
+        self.release_stream()
+        self.worker.stop()
+        self.scheduler.stop()
 
         return super().closeEvent(event)
 
@@ -237,99 +283,142 @@ class Tuner(QtWidgets.QWidget):
         self.restart_stream(api, index)
 
     def input_api_changed(self, index):
-        self.form.input_devices_box.clear()
+        box = self.form.input_devices_box
         logger.debug(index)
-        api = self.form.input_api_box.itemData(index)
-        for i in range(api.get('deviceCount')):
-            info = self.audio.get_device_info_by_host_api_device_index(index, i)
-            if info.get('maxInputChannels') == 0:
-                continue
-            logger.info(info)
-            self.form.input_devices_box.addItem(
-                info.get('name'),
-                userData=info
-            )
-        self.restart_stream(api, 0)
-
-    def update_note(self, freq: float):
-        if freq < 27.5 or freq > 5000:
-            return
-
-        n = 12 * np.log2(freq / self.A0)
-        if n > 88 or n < 0:
+        # the device list comes from the hub's cache, nothing is queried here
+        box.blockSignals(True)
+        box.clear()
+        for info in self.form.input_api_box.itemData(index) or []:
+            logger.info("input device %s", info.get('name'))
+            logger.debug("%s", info)
+            box.addItem(info.get('name'), userData=info)
+        box.blockSignals(False)
+        self.restart_stream(index, 0)
+
+    def update_note(self, result: PitchResult):
+        if result.note is None:
             return
 
-        self.form.hertz.setText(f'{freq:04.02f}')
+        self.form.hertz.setText(f'{result.frequency:04.02f}')
+        self.form.cents.setText(f'{result.cents:+.02f}')
+        self.centbar.update_data(result.cents)
 
-        cents = (n - round(n)) * 100
-        self.form.cents.setText(f'{cents:+.02f}')
-        self.centbar.update_data(cents)
-
-        # logger.debug(n)
-
-        number, note = divmod(round(n), 12)
-        name = self.NOTENAMES[note]
+        name = result.note
         self.form.note.setText(name[0])
         if len(name) > 1:
             self.form.accidental.setText(name[1])
         else:
             self.form.accidental.setText(" ")
-        if note > 2:  # start with A0 A#0 B0 C1 ...
-            number += 1
-        self.form.number.setText(str(number))
-
-    def draw_frame(self, buffer: np.ndarray, spectrum: np.ndarray, optimized: np.ndarray, frequency: float):
-        self.update_note(frequency)
-        self.spectrum_canvas.update_data(self.frequencies, spectrum, optimized, frequency)
-        self.audio_canvas.update_data(buffer)
-
-    def algorithm_harmonic_product_spectrum(self, buffer: np.array):
-
-        spectrum = np.absolute(np.fft.fft(buffer))
-
-        # shannon nyquist theorem
-        spectrum = spectrum[:len(self.buffer) // 2]
-
-        # todo (Harmonic Product Spectrum)
-        # reference:
-        # http://musicweb.ucsd.edu/~trsmyth/analysis/Harmonic_Product_Spectrum.html
-        optimized = spectrum.copy()
-        for harmonic in range(2, self.HPS_HARMONICS + 1):
-            hps_len = int(np.ceil(len(spectrum) / harmonic))
-            optimized[:hps_len] *= spectrum[::harmonic]
-
-        # smooth low frequencis
-        args = np.argwhere(self.frequencies < 200)[-1, 0]
-        x = (np.arange(args) - args // 2) / args * 8
-        optimized[:args] *= scispecial.expit(x)
-
-        return spectrum, optimized
-
-    def stream_callback(self, data, frame_count, time_info, status):
-        # logger.debug("input stream data len %s %s", len(data), type(data))
-        frame = np.frombuffer(data, np.int16)
-
-        # References:
-        # https://github.com/TomSchimansky/GuitarTuner
-        self.buffer[:-self.CHUNK_SIZE] = self.buffer[self.CHUNK_SIZE:]
-        self.buffer[-self.CHUNK_SIZE:] = frame
-
-        # self.buffer[np.abs(self.buffer) < .0] = 0.0
-
-        buffer = self.buffer * self.hanning
-
-        spectrum, optimized = self.algorithm_harmonic_product_spectrum(buffer)
-
-        frequency = self.frequencies[np.argmax(optimized)]
-
-        self.signal.frame.emit(self.buffer, spectrum, optimized, frequency)
+        self.form.number.setText(str(result.octave))
+
+    def receive_frame(self, frame: AnalysisFrame):
+        # queued from the worker thread
+        stats.record('delivery', time.perf_counter() - frame.published)
+        self.scheduler.submit(frame)
+
+    def draw_frame(self, frame: AnalysisFrame):
+        with stats.time('draw'):
+            with stats.time('update note'):
+                self.update_note(frame.result)
+            # before the spectrum canvas normalizes the spectrum in place
+            with stats.time('update spectrogram'):
+                self.spectrogram.update_data(frame.frequencies, frame.spectrum)
+            with stats.time('update spectrum'):
+                self.spectrum_canvas.update_data(frame.frequencies, frame.spectrum, frame.optimized, frame.frequency)
+            with stats.time('update audio'):
+                self.audio_canvas.update_data(frame.buffer)
+            self.setToolTip(self.status(frame))
+        # from the end of the analysis until the canvases have their data
+        stats.record('frame age', time.perf_counter() - frame.published)
+
+    def keyPressEvent(self, event: QKeyEvent) -> None:
+        if event.key() == QtCore.Qt.Key_F3:
+            self.overlay.setVisible(not self.overlay.isVisible())
+            if self.overlay.isVisible():
+                self.update_overlay()
+                self.overlay_timer.start()
+            else:
+                self.overlay_timer.stop()
+        elif event.key() == QtCore.Qt.Key_F4:
+            stats.dump(self.STATS_FILE)
+            logger.info("stats written to %s", os.path.abspath(self.STATS_FILE))
+        elif event.key() == QtCore.Qt.Key_F5:
+            # devices plugged in since start, the stream is reopened after
+            self.release_stream()
+            self.list_devices(refresh=True)
+        else:
+            super().keyPressEvent(event)
+
+    def update_overlay(self):
+        stats.counters['samples dropped'] = self.worker.input.dropped
+        stats.counters['frames dropped'] = self.scheduler.dropped
+        self.overlay.setText(stats.report())
+        self.overlay.adjustSize()
+        self.overlay.raise_()
+
+    def status(self, frame: AnalysisFrame):
+        scheduler = self.scheduler
+        return (
+            f'{frame.cost * 1000:.2f} ms per analysis, {frame.skipped} analyses skipped\n'
+            f'{scheduler.paint_time * 1000:.2f} ms per paint (max {scheduler.max_paint_time * 1000:.2f}), '
+            f'{scheduler.dropped} of {scheduler.received} frames dropped'
+        )
 
-        return (data, pyaudio.paContinue)
+    def analyse_frame(self):
+        # the gui still holds every snapshot, it is behind anyway
+        snapshot = self.snapshots.acquire()
+        if snapshot is None:
+            return None
+
+        engine = self.engine
+        result = engine.analyse()
+        if result is None:
+            self.snapshots.release(snapshot)
+            return None
+
+        # snapshot is owned by the gui until draw_frame releases it
+        plan = engine.plan
+        engine.buffer.read(snapshot.buffer)
+        np.copyto(snapshot.spectrum, plan.spectrum)
+        np.copyto(snapshot.optimized, plan.optimized)
+        snapshot.frequencies = plan.frequencies
+        snapshot.frequency = result.frequency
+        snapshot.confidence = result.confidence
+        snapshot.result = result
+        snapshot.cost = engine.detector.cost
+        snapshot.skipped = engine.gate.skipped
+        snapshot.published = time.perf_counter()
+        return snapshot
 
 
 if __name__ == '__main__':
-    app = QtWidgets.QApplication(sys.argv)
+    # python tuner.py take.wav --speed 0 analyses and paints as fast as it can,
+    # QT_QPA_PLATFORM=offscreen runs it without a display, --record keeps
+    # the raw input and python tuner.py <recording>.musrec replays it
+    parser = argparse.ArgumentParser(description="tuner, on a device, audio files or test tones")
+    parser.add_argument('files', nargs='*', help="audio files listed as devices")
+    parser.add_argument('--synthetic', type=float, nargs='+', metavar='HZ', help="test tones listed as devices")
+    parser.add_argument('--speed', type=float, default=1.0, help="times real time for files and tones, 0 for no limit")
+    parser.add_argument('--jitter', type=float, default=0.0, help="test tone chunks come up to this many blocks late")
+    parser.add_argument('--dropout', type=float, default=0.0, help="probability a test tone chunk is lost")
+    parser.add_argument('--blocking', action='store_true', help="blocking reads instead of PortAudio callbacks")
+    parser.add_argument('--record', metavar='DIR', help="record the raw input to DIR, the files replay like audio files")
+    args, rest = parser.parse_known_args()
+    if args.blocking:
+        hub.mode = 'blocking'
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+        hub.recordings = args.record
+    for path in args.files:
+        hub.add_file(path, args.speed)
+    for frequency in args.synthetic or []:
+        hub.add_synthetic(frequency=frequency, speed=args.speed, jitter=args.jitter, dropout=args.dropout)
+    if args.files or args.synthetic:
+        Tuner.HOST_API = 'Virtual'
+
+    app = QtWidgets.QApplication(sys.argv[:1] + rest)
     wnd = Tuner()
     # wnd = CentBar()
     wnd.show()
     app.exec()
+    hub.terminate()
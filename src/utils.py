@@ -4,13 +4,9 @@ import os
 import sys
 
 import numpy as np
-import matplotlib.pyplot as plt
 
 import scipy.special as scispecial
 
-from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
-from matplotlib.figure import Figure
-
 from PySide6 import (
     QtWidgets,
     QtCore,
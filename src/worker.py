@@ -0,0 +1,119 @@
+# coding=utf-8
+
+import logging
+import threading
+import collections
+
+from logger import logger, RateLimit
+from ringbuffer import ConsumerBuffer
+
+
+class AnalysisWorker(threading.Thread):
+
+    # input samples held for the worker, about 1.5 s at 44.1 kHz
+    CAPACITY = ConsumerBuffer.CAPACITY
+    WAIT_TIMEOUT = 0.5
+
+    def __init__(self, feed, analyse, publish, hop: int = 0, capacity: int = CAPACITY) -> None:
+        super().__init__(name='AnalysisWorker', daemon=True)
+        # feed(frame) appends one chunk to the analysis buffer
+        # analyse() runs the pitch analysis over the current buffer
+        # publish(result) delivers the result to the consumer (GUI)
+        self.feed = feed
+        self.analyse = analyse
+        self.publish = publish
+
+        # input samples between two analyses, independent of the size of
+        # the chunks written to input, 0 analyses once per chunk
+        self.hop = hop
+        self.fed = 0
+        self.boundary = 0
+
+        self.wakeup = threading.Event()
+        # the audio thread writes to the ring without ever waiting, when the
+        # worker is a whole ring behind the oldest samples are overwritten
+        self.input = ConsumerBuffer('analysis', capacity, ConsumerBuffer.OLDEST, self.wakeup.set)
+        # reconfiguration requests, run on this thread between two analyses
+        self.tasks = collections.deque()
+        self.running = False
+        self.error_log = RateLimit(5.0, logging.ERROR)
+
+        self.skipped = 0
+        self.analysed = 0
+
+    def invoke(self, task):
+        self.tasks.append(task)
+        self.wakeup.set()
+
+    def clear(self):
+        self.input.clear()
+
+    def start(self):
+        self.running = True
+        super().start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.is_alive():
+            self.join(self.WAIT_TIMEOUT * 2)
+
+    def run(self):
+        logger.info("analysis worker started")
+        while self.running:
+            if not self.wakeup.wait(self.WAIT_TIMEOUT):
+                continue
+            self.wakeup.clear()
+
+            while self.tasks:
+                try:
+                    self.tasks.popleft()()
+                except Exception as e:
+                    logger.exception(e)
+
+            samples = self.input.read()
+            if len(samples):
+                # the latest chunk alone is newest, the rest is backlog
+                split = max(0, len(samples) - self.input.last)
+                self.process([chunk for chunk in (samples[:split], samples[split:]) if len(chunk)])
+        logger.info("analysis worker stopped")
+
+    def process(self, chunks):
+        # Chunks are cut at the hop boundaries. Boundaries inside the newest
+        # chunk are all analysed, older ones are stale: they are only fed
+        # to the buffer and one analysis at the end replaces them all.
+        stale = False
+        for index, chunk in enumerate(chunks):
+            newest = index == len(chunks) - 1
+            hop = self.hop or len(chunk)
+            start = 0
+            while start < len(chunk):
+                if self.boundary <= self.fed:
+                    self.boundary = self.fed + hop
+                end = min(len(chunk), start + self.boundary - self.fed)
+                self.feed(chunk[start:end])
+                self.fed += end - start
+                start = end
+                if self.fed < self.boundary:
+                    continue
+                if not newest:
+                    self.skipped += 1
+                    stale = True
+                    continue
+                stale = False
+                self.step()
+        if stale:
+            self.skipped -= 1
+            self.boundary = self.fed + (self.hop or len(chunks[-1]))
+            self.step()
+
+    def step(self):
+        try:
+            result = self.analyse()
+        except Exception as e:
+            # once per frame otherwise
+            self.error_log("analysis failed: %s", e, exc_info=True)
+            return
+        self.analysed += 1
+        if result is not None:
+            self.publish(result)